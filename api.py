@@ -7,6 +7,7 @@ from flask_cors import CORS
 from functools import wraps
 import cv2
 import numpy as np
+import atexit
 import base64
 import os
 import sys
@@ -14,6 +15,13 @@ import jwt
 import bcrypt
 from datetime import datetime, timedelta
 
+try:
+    # Optional: SIMD JPEG decode straight to BGR (needs the libturbojpeg library)
+    from turbojpeg import TurboJPEG
+    _turbo_jpeg = TurboJPEG()
+except Exception:
+    _turbo_jpeg = None
+
 # Add parent dir to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
@@ -21,6 +29,7 @@ from modules.face_detector import FaceDetector
 from modules.embeddings import EmbeddingGenerator
 from modules.verifier import Verifier
 from database.db_manager import DatabaseManager
+from utils.helpers import generate_user_id
 from config import DUPLICATE_THRESHOLD, VERIFICATION_THRESHOLD
 
 app = Flask(__name__)
@@ -46,6 +55,7 @@ def init_models():
         embedding_gen = EmbeddingGenerator()
         verifier = Verifier()
         db = DatabaseManager()
+        atexit.register(db.close)
         print("Models loaded!")
 
 
@@ -57,6 +67,14 @@ def decode_base64_image(base64_string):
             base64_string = base64_string.split(',')[1]
         
         img_data = base64.b64decode(base64_string)
+        
+        # Webcam captures arrive as JPEG; TurboJPEG decodes them to BGR directly
+        if _turbo_jpeg is not None and img_data[:2] == b'\xff\xd8':
+            try:
+                return _turbo_jpeg.decode(img_data)
+            except Exception:
+                pass
+        
         nparr = np.frombuffer(img_data, np.uint8)
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         return img
@@ -272,7 +290,7 @@ def enroll_user():
     face = detector.get_largest_face(faces)
     
     # Generate embedding
-    embedding = embedding_gen.generate_embedding(face['face_img'])
+    embedding = embedding_gen.generate_embedding(face.face_img)
     if embedding is None:
         return jsonify({'success': False, 'error': 'Failed to generate face embedding'}), 500
     
@@ -288,7 +306,7 @@ def enroll_user():
     
     # Generate user ID if not provided
     if not user_id:
-        user_id = f"user_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        user_id = generate_user_id()
     
     # Check if user ID exists
     if db.user_exists(user_id):
@@ -299,6 +317,7 @@ def enroll_user():
         return jsonify({'success': False, 'error': 'Failed to save user'}), 500
     
     db.add_embedding(user_id, embedding)
+    verifier.add_to_cache(user_id, name, [embedding], owner_id=g.account_id)
     
     return jsonify({
         'success': True,
@@ -339,7 +358,7 @@ def verify_face():
     face = detector.get_largest_face(faces)
     
     # Generate embedding
-    embedding = embedding_gen.generate_embedding(face['face_img'])
+    embedding = embedding_gen.generate_embedding(face.face_img)
     if embedding is None:
         return jsonify({'success': False, 'error': 'Failed to generate face embedding'}), 500
     
@@ -354,7 +373,7 @@ def verify_face():
         'user_id': result['user_id'],
         'confidence': float(result['confidence']) if result['confidence'] else 0.0,
         'distance': float(result['distance']) if result['distance'] else 1.0,
-        'face_box': [int(x) for x in face['box']]
+        'face_box': [int(x) for x in face.box]
     }
     
     return jsonify(response)
@@ -382,6 +401,7 @@ def delete_user(user_id):
     init_models()
     
     if db.delete_user(user_id, owner_id=g.account_id):
+        verifier.invalidate_cache(user_id)
         return jsonify({
             'success': True,
             'message': f'User {user_id} deleted successfully'
@@ -16,6 +16,9 @@ TARGET_FPS = 30
 FACE_DETECTOR_BACKEND = "opencv"  # Options: opencv, mtcnn, retinaface, ssd
 MIN_FACE_SIZE = 50  # Minimum face size in pixels (lowered for low-res cameras)
 FACE_DETECTION_CONFIDENCE = 0.4
+DETECTION_MAX_DIM = 640  # Larger frames are downscaled for detection, boxes scaled back
+# YuNet ONNX model (int8) used by the "opencv" backend instead of Haar when present
+YUNET_MODEL_PATH = os.path.join(BASE_DIR, "models", "face_detection_yunet_2023mar_int8.onnx")
 
 # Embedding settings - Using Facenet512 for BETTER accuracy (512-dim embeddings)
 EMBEDDING_MODEL = "Facenet512"  # More detailed than Facenet (128-dim)
@@ -29,8 +32,13 @@ VERIFICATION_MAJORITY = 3  # Minimum matches needed for verification
 # Duplicate detection - even stricter
 DUPLICATE_THRESHOLD = 0.20  # Super strict for duplicate check
 
+# Above this many stored embeddings, search an approximate HNSW index instead of an exact scan
+ANN_INDEX_THRESHOLD = 1000
+
 # Quality check settings (DISABLED - accept any quality)
 BLUR_THRESHOLD = 1  # Accept almost any blur level
+BLUR_METRIC = "laplacian"  # Options: laplacian, integral (block variance from integral images)
+BLUR_THRESHOLD_INTEGRAL = 1  # Threshold used when BLUR_METRIC = "integral"
 BRIGHTNESS_MIN = 1  # Accept very dark images
 BRIGHTNESS_MAX = 255  # Accept very bright images
 
@@ -41,10 +49,17 @@ BLINK_CONSECUTIVE_FRAMES = 2  # Frames to confirm a blink
 
 # Database settings
 DATABASE_PATH = os.path.join(BASE_DIR, "database", "face_db.sqlite")
+EMBEDDING_STORAGE_DTYPE = "float16"  # On-disk embedding precision: "float32", "float16" or "int8" (loaded as float32)
 
 # Enrolled images directory
 ENROLLED_IMAGES_DIR = os.path.join(BASE_DIR, "enrolled_images")
 
+# Run detection, embedding and search on a CUDA GPU when one is available
+USE_GPU = True
+
+# Serialized model cache (speeds up start-up after the first run)
+MODEL_CACHE_DIR = os.path.join(BASE_DIR, "cache")
+
 # Ensure directories exist
 os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
 os.makedirs(ENROLLED_IMAGES_DIR, exist_ok=True)
@@ -3,10 +3,52 @@ Database Manager Module - Handles SQLite database operations for face embeddings
 With Multi-User Authentication Support
 """
 import sqlite3
+import threading
 import numpy as np
 import os
+from contextlib import contextmanager
 from datetime import datetime
-from config import DATABASE_PATH
+from config import DATABASE_PATH, EMBEDDING_STORAGE_DTYPE
+
+
+def _encode_embedding(embedding):
+    """
+    Convert an embedding to a blob at EMBEDDING_STORAGE_DTYPE
+    
+    "int8" uses symmetric per-vector quantization: the vector is divided by
+    max(|x|) / 127 and rounded, and that scale is stored alongside it.
+    
+    Args:
+        embedding: Numpy array embedding vector
+        
+    Returns:
+        tuple: (bytes, dtype name, scale or None)
+    """
+    if EMBEDDING_STORAGE_DTYPE != 'int8':
+        return np.asarray(embedding, dtype=EMBEDDING_STORAGE_DTYPE).tobytes(), EMBEDDING_STORAGE_DTYPE, None
+    
+    embedding = np.asarray(embedding, dtype=np.float32)
+    scale = float(np.abs(embedding).max()) / 127.0 or 1.0
+    quantized = np.clip(np.rint(embedding / scale), -127, 127).astype(np.int8)
+    return quantized.tobytes(), 'int8', scale
+
+
+def _decode_embedding(blob, dtype, scale=None):
+    """
+    Convert a stored embedding blob to a float32 vector
+    
+    Args:
+        blob: Raw bytes from the embeddings table
+        dtype: Stored dtype name (None for legacy rows, which are float64)
+        scale: Dequantization scale for int8 rows
+        
+    Returns:
+        numpy array: Float32 embedding
+    """
+    embedding = np.frombuffer(blob, dtype=dtype or 'float64').astype(np.float32)
+    if scale is not None:
+        embedding *= scale
+    return embedding
 
 
 class DatabaseManager:
@@ -21,8 +63,28 @@ class DatabaseManager:
         """
         self.db_path = db_path
         self._ensure_db_exists()
+        
+        # One long-lived connection shared by all threads (GUI workers, Flask
+        # requests); the lock serializes access, transactions are explicit
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA temp_store=MEMORY')
+        self.conn.execute('PRAGMA cache_size=-64000')
+        # Enforce the schema's ON DELETE CASCADE (off by default in SQLite)
+        self.conn.execute('PRAGMA foreign_keys=ON')
+        
+        # Bumped by every committed write; keys the load_matrix() cache
+        self.version = 0
+        self._matrix_cache = {}
+        
         self._create_tables()
         self._migrate_tables()
+        
+        # Recommended for long-lived connections: analyze any tables whose
+        # statistics are stale (0x10000 also covers tables never analyzed)
+        self.conn.execute('PRAGMA optimize=0x10002')
     
     def _ensure_db_exists(self):
         """Ensure database directory exists"""
@@ -30,66 +92,103 @@ class DatabaseManager:
         if db_dir and not os.path.exists(db_dir):
             os.makedirs(db_dir)
     
-    def _get_connection(self):
-        """Get database connection"""
-        return sqlite3.connect(self.db_path)
+    @contextmanager
+    def _cursor(self):
+        """Cursor on the shared connection for reads"""
+        with self._lock:
+            cursor = self.conn.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+    
+    @contextmanager
+    def _transaction(self):
+        """Cursor inside a transaction, committed on success and rolled back on error"""
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute('BEGIN')
+            try:
+                yield cursor
+                cursor.execute('COMMIT')
+                self.version += 1
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+            finally:
+                cursor.close()
+    
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            # Let SQLite refresh query-planner statistics if they are stale
+            self.conn.execute('PRAGMA optimize')
+            self.conn.close()
     
     def _create_tables(self):
         """Create database tables if they don't exist"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        # Accounts table (for user authentication)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS accounts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                name TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Users table (enrolled faces)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                owner_id INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (owner_id) REFERENCES accounts(id) ON DELETE CASCADE
-            )
-        ''')
-        
-        # Embeddings table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS embeddings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                embedding BLOB NOT NULL,
-                image_path TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        with self._transaction() as cursor:
+            # Accounts table (for user authentication)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS accounts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    email TEXT UNIQUE NOT NULL,
+                    password_hash TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Users table (enrolled faces)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    owner_id INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (owner_id) REFERENCES accounts(id) ON DELETE CASCADE
+                )
+            ''')
+            
+            # Embeddings table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    dtype TEXT,
+                    scale REAL,
+                    image_path TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+                )
+            ''')
+            
+            # get_embeddings and delete_user filter on user_id
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_embeddings_user ON embeddings(user_id)')
     
     def _migrate_tables(self):
-        """Add owner_id column if it doesn't exist (for existing databases)"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        # Check if owner_id column exists
-        cursor.execute("PRAGMA table_info(users)")
-        columns = [col[1] for col in cursor.fetchall()]
-        
-        if 'owner_id' not in columns:
-            cursor.execute('ALTER TABLE users ADD COLUMN owner_id INTEGER REFERENCES accounts(id)')
-            conn.commit()
-        
-        conn.close()
+        """Add owner_id, dtype and scale columns if they don't exist (for existing databases)"""
+        with self._transaction() as cursor:
+            # Check if owner_id column exists
+            cursor.execute("PRAGMA table_info(users)")
+            columns = [col[1] for col in cursor.fetchall()]
+            
+            if 'owner_id' not in columns:
+                cursor.execute('ALTER TABLE users ADD COLUMN owner_id INTEGER REFERENCES accounts(id)')
+            
+            # Per-account user listings and joins filter on owner_id
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_owner ON users(owner_id)')
+            
+            # Embeddings written before the dtype column existed are float64 (dtype NULL)
+            cursor.execute("PRAGMA table_info(embeddings)")
+            columns = [col[1] for col in cursor.fetchall()]
+            
+            if 'dtype' not in columns:
+                cursor.execute('ALTER TABLE embeddings ADD COLUMN dtype TEXT')
+            
+            if 'scale' not in columns:
+                cursor.execute('ALTER TABLE embeddings ADD COLUMN scale REAL')
     
     # ==================== ACCOUNT METHODS ====================
     
@@ -106,17 +205,13 @@ class DatabaseManager:
             int: Account ID or None if failed
         """
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                'INSERT INTO accounts (email, password_hash, name) VALUES (?, ?, ?)',
-                (email, password_hash, name)
-            )
-            
-            account_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+            with self._transaction() as cursor:
+                cursor.execute(
+                    'INSERT INTO accounts (email, password_hash, name) VALUES (?, ?, ?)',
+                    (email, password_hash, name)
+                )
+                
+                account_id = cursor.lastrowid
             return account_id
             
         except sqlite3.IntegrityError:
@@ -132,16 +227,13 @@ class DatabaseManager:
         Returns:
             dict: Account data or None
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            'SELECT id, email, password_hash, name, created_at FROM accounts WHERE email = ?',
-            (email,)
-        )
-        
-        row = cursor.fetchone()
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute(
+                'SELECT id, email, password_hash, name, created_at FROM accounts WHERE email = ?',
+                (email,)
+            )
+            
+            row = cursor.fetchone()
         
         if row:
             return {
@@ -163,16 +255,13 @@ class DatabaseManager:
         Returns:
             dict: Account data or None
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            'SELECT id, email, name, created_at FROM accounts WHERE id = ?',
-            (account_id,)
-        )
-        
-        row = cursor.fetchone()
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute(
+                'SELECT id, email, name, created_at FROM accounts WHERE id = ?',
+                (account_id,)
+            )
+            
+            row = cursor.fetchone()
         
         if row:
             return {
@@ -198,16 +287,11 @@ class DatabaseManager:
             bool: True if successful, False if user already exists
         """
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                'INSERT INTO users (user_id, name, owner_id) VALUES (?, ?, ?)',
-                (user_id, name, owner_id)
-            )
-            
-            conn.commit()
-            conn.close()
+            with self._transaction() as cursor:
+                cursor.execute(
+                    'INSERT INTO users (user_id, name, owner_id) VALUES (?, ?, ?)',
+                    (user_id, name, owner_id)
+                )
             return True
             
         except sqlite3.IntegrityError:
@@ -224,22 +308,19 @@ class DatabaseManager:
         Returns:
             dict: User data or None
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        if owner_id is not None:
-            cursor.execute(
-                'SELECT user_id, name, owner_id, created_at FROM users WHERE user_id = ? AND owner_id = ?',
-                (user_id, owner_id)
-            )
-        else:
-            cursor.execute(
-                'SELECT user_id, name, owner_id, created_at FROM users WHERE user_id = ?',
-                (user_id,)
-            )
-        
-        row = cursor.fetchone()
-        conn.close()
+        with self._cursor() as cursor:
+            if owner_id is not None:
+                cursor.execute(
+                    'SELECT user_id, name, owner_id, created_at FROM users WHERE user_id = ? AND owner_id = ?',
+                    (user_id, owner_id)
+                )
+            else:
+                cursor.execute(
+                    'SELECT user_id, name, owner_id, created_at FROM users WHERE user_id = ?',
+                    (user_id,)
+                )
+            
+            row = cursor.fetchone()
         
         if row:
             return {
@@ -260,19 +341,16 @@ class DatabaseManager:
         Returns:
             list: List of user dictionaries
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        if owner_id is not None:
-            cursor.execute(
-                'SELECT user_id, name, owner_id, created_at FROM users WHERE owner_id = ? ORDER BY created_at DESC',
-                (owner_id,)
-            )
-        else:
-            cursor.execute('SELECT user_id, name, owner_id, created_at FROM users ORDER BY created_at DESC')
-        
-        rows = cursor.fetchall()
-        conn.close()
+        with self._cursor() as cursor:
+            if owner_id is not None:
+                cursor.execute(
+                    'SELECT user_id, name, owner_id, created_at FROM users WHERE owner_id = ? ORDER BY created_at DESC',
+                    (owner_id,)
+                )
+            else:
+                cursor.execute('SELECT user_id, name, owner_id, created_at FROM users ORDER BY created_at DESC')
+            
+            rows = cursor.fetchall()
         
         return [
             {'user_id': row[0], 'name': row[1], 'owner_id': row[2], 'created_at': row[3]}
@@ -290,30 +368,15 @@ class DatabaseManager:
         Returns:
             bool: True if user was deleted
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        # Verify ownership if owner_id provided
-        if owner_id is not None:
-            cursor.execute('SELECT owner_id FROM users WHERE user_id = ?', (user_id,))
-            row = cursor.fetchone()
-            if not row or row[0] != owner_id:
-                conn.close()
-                return False
-        
-        # Delete embeddings first
-        cursor.execute('DELETE FROM embeddings WHERE user_id = ?', (user_id,))
-        
-        # Delete user (with owner check if specified)
-        if owner_id is not None:
-            cursor.execute('DELETE FROM users WHERE user_id = ? AND owner_id = ?', (user_id, owner_id))
-        else:
-            cursor.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
-        
-        deleted = cursor.rowcount > 0
-        
-        conn.commit()
-        conn.close()
+        with self._transaction() as cursor:
+            # Embeddings are removed by ON DELETE CASCADE; the owner check
+            # is part of the WHERE clause, so other accounts' users match nothing
+            if owner_id is not None:
+                cursor.execute('DELETE FROM users WHERE user_id = ? AND owner_id = ?', (user_id, owner_id))
+            else:
+                cursor.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
+            
+            deleted = cursor.rowcount > 0
         
         return deleted
     
@@ -330,28 +393,57 @@ class DatabaseManager:
             int: Embedding ID or None if failed
         """
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            # Convert embedding to bytes
-            embedding_bytes = embedding.tobytes()
-            
-            cursor.execute(
-                'INSERT INTO embeddings (user_id, embedding, image_path) VALUES (?, ?, ?)',
-                (user_id, embedding_bytes, image_path)
-            )
-            
-            embedding_id = cursor.lastrowid
-            
-            conn.commit()
-            conn.close()
+            with self._transaction() as cursor:
+                # Convert embedding to bytes at the storage precision
+                embedding_bytes, dtype, scale = _encode_embedding(embedding)
+                
+                cursor.execute(
+                    'INSERT INTO embeddings (user_id, embedding, dtype, scale, image_path) VALUES (?, ?, ?, ?, ?)',
+                    (user_id, embedding_bytes, dtype, scale, image_path)
+                )
+                
+                embedding_id = cursor.lastrowid
             
             return embedding_id
             
-        except Exception as e:
+        except sqlite3.IntegrityError as e:
             print(f"Error adding embedding: {e}")
             return None
     
+    def add_embeddings_bulk(self, user_id, embeddings, image_paths=None):
+        """
+        Add several embeddings for a user in a single transaction
+        
+        Args:
+            user_id: User identifier
+            embeddings: List of numpy array embedding vectors
+            image_paths: Optional list of source image paths (same length)
+            
+        Returns:
+            int: Number of embeddings stored (0 if failed)
+        """
+        if image_paths is None:
+            image_paths = [None] * len(embeddings)
+        
+        rows = [
+            (user_id, *_encode_embedding(embedding), image_path)
+            for embedding, image_path in zip(embeddings, image_paths)
+        ]
+        
+        try:
+            with self._transaction() as cursor:
+                # One executemany and one commit instead of a connection and fsync per row
+                cursor.executemany(
+                    'INSERT INTO embeddings (user_id, embedding, dtype, scale, image_path) VALUES (?, ?, ?, ?, ?)',
+                    rows
+                )
+            
+            return len(rows)
+            
+        except sqlite3.IntegrityError as e:
+            print(f"Error adding embeddings: {e}")
+            return 0
+    
     def get_embeddings(self, user_id):
         """
         Get all embeddings for a user
@@ -360,24 +452,26 @@ class DatabaseManager:
             user_id: User identifier
             
         Returns:
-            list: List of numpy array embeddings
+            numpy array: (N, D) float32 matrix, one embedding per row
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            'SELECT embedding FROM embeddings WHERE user_id = ?',
-            (user_id,)
-        )
+        with self._cursor() as cursor:
+            cursor.execute(
+                'SELECT embedding, dtype, scale FROM embeddings WHERE user_id = ?',
+                (user_id,)
+            )
+            
+            rows = cursor.fetchall()
         
-        rows = cursor.fetchall()
-        conn.close()
+        if not rows:
+            return np.empty((0, 0), dtype=np.float32)
         
-        embeddings = []
-        for row in rows:
-            # Convert bytes back to numpy array
-            embedding = np.frombuffer(row[0], dtype=np.float64)
-            embeddings.append(embedding)
+        # Decode each blob straight into a preallocated row (no per-row arrays)
+        dim = len(rows[0][0]) // np.dtype(rows[0][1] or 'float64').itemsize
+        embeddings = np.empty((len(rows), dim), dtype=np.float32)
+        for i, (blob, dtype, scale) in enumerate(rows):
+            embeddings[i] = np.frombuffer(blob, dtype=dtype or 'float64')
+            if scale is not None:
+                embeddings[i] *= scale
         
         return embeddings
     
@@ -391,29 +485,26 @@ class DatabaseManager:
         Returns:
             list: List of (user_id, name, embedding) tuples
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        if owner_id is not None:
-            cursor.execute('''
-                SELECT u.user_id, u.name, e.embedding 
-                FROM users u 
-                JOIN embeddings e ON u.user_id = e.user_id 
-                WHERE u.owner_id = ?
-            ''', (owner_id,))
-        else:
-            cursor.execute('''
-                SELECT u.user_id, u.name, e.embedding 
-                FROM users u 
-                JOIN embeddings e ON u.user_id = e.user_id
-            ''')
-        
-        rows = cursor.fetchall()
-        conn.close()
+        with self._cursor() as cursor:
+            if owner_id is not None:
+                cursor.execute('''
+                    SELECT u.user_id, u.name, e.embedding, e.dtype, e.scale 
+                    FROM users u 
+                    JOIN embeddings e ON u.user_id = e.user_id 
+                    WHERE u.owner_id = ?
+                ''', (owner_id,))
+            else:
+                cursor.execute('''
+                    SELECT u.user_id, u.name, e.embedding, e.dtype, e.scale 
+                    FROM users u 
+                    JOIN embeddings e ON u.user_id = e.user_id
+                ''')
+            
+            rows = cursor.fetchall()
         
         result = []
         for row in rows:
-            embedding = np.frombuffer(row[2], dtype=np.float64)
+            embedding = _decode_embedding(row[2], row[3], row[4])
             result.append({
                 'user_id': row[0],
                 'name': row[1],
@@ -422,6 +513,59 @@ class DatabaseManager:
         
         return result
     
+    def load_matrix(self, owner_id=None):
+        """
+        Load all embeddings as one float32 matrix (cached until the data changes)
+        
+        The cache is keyed by PRAGMA data_version, which changes when another
+        connection or process commits, together with this instance's own
+        write version (data_version ignores this connection's commits).
+        
+        Args:
+            owner_id: Account ID to filter by (None = all users)
+            
+        Returns:
+            tuple: (read-only (N, D) float32 matrix, (N,) array of user_ids)
+        """
+        with self._cursor() as cursor:
+            cursor.execute('PRAGMA data_version')
+            version = (cursor.fetchone()[0], self.version)
+            
+            cached = self._matrix_cache.get(owner_id)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            
+            if owner_id is not None:
+                cursor.execute('''
+                    SELECT e.user_id, e.embedding, e.dtype, e.scale 
+                    FROM embeddings e 
+                    JOIN users u ON e.user_id = u.user_id 
+                    WHERE u.owner_id = ?
+                ''', (owner_id,))
+            else:
+                cursor.execute('SELECT user_id, embedding, dtype, scale FROM embeddings')
+            
+            rows = cursor.fetchall()
+        
+        if not rows:
+            matrix = np.empty((0, 0), dtype=np.float32)
+        elif len({row[2] for row in rows}) == 1:
+            # Uniform storage dtype: decode every blob with one frombuffer call
+            dtype = rows[0][2] or 'float64'
+            blob = b''.join(row[1] for row in rows)
+            matrix = np.frombuffer(blob, dtype=dtype).reshape(len(rows), -1).astype(np.float32)
+            if dtype == 'int8':
+                # Dequantize every row with one broadcast multiply
+                matrix *= np.array([row[3] for row in rows], dtype=np.float32)[:, None]
+        else:
+            matrix = np.stack([_decode_embedding(row[1], row[2], row[3]) for row in rows])
+        
+        matrix.flags.writeable = False
+        user_ids = np.array([row[0] for row in rows], dtype=object)
+        
+        self._matrix_cache[owner_id] = (version, (matrix, user_ids))
+        return matrix, user_ids
+    
     def get_embedding_count(self, user_id):
         """
         Get number of embeddings for a user
@@ -432,16 +576,13 @@ class DatabaseManager:
         Returns:
             int: Number of embeddings
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            'SELECT COUNT(*) FROM embeddings WHERE user_id = ?',
-            (user_id,)
-        )
-        
-        count = cursor.fetchone()[0]
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute(
+                'SELECT COUNT(*) FROM embeddings WHERE user_id = ?',
+                (user_id,)
+            )
+            
+            count = cursor.fetchone()[0]
         
         return count
     
@@ -467,27 +608,23 @@ class DatabaseManager:
         Returns:
             dict: Statistics about users and embeddings
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        if owner_id is not None:
-            cursor.execute('SELECT COUNT(*) FROM users WHERE owner_id = ?', (owner_id,))
-            user_count = cursor.fetchone()[0]
+        with self._cursor() as cursor:
+            if owner_id is not None:
+                cursor.execute('SELECT COUNT(*) FROM users WHERE owner_id = ?', (owner_id,))
+                user_count = cursor.fetchone()[0]
             
-            cursor.execute('''
-                SELECT COUNT(*) FROM embeddings e 
-                JOIN users u ON e.user_id = u.user_id 
-                WHERE u.owner_id = ?
-            ''', (owner_id,))
-            embedding_count = cursor.fetchone()[0]
-        else:
-            cursor.execute('SELECT COUNT(*) FROM users')
-            user_count = cursor.fetchone()[0]
+                cursor.execute('''
+                    SELECT COUNT(*) FROM embeddings e 
+                    JOIN users u ON e.user_id = u.user_id 
+                    WHERE u.owner_id = ?
+                ''', (owner_id,))
+                embedding_count = cursor.fetchone()[0]
+            else:
+                cursor.execute('SELECT COUNT(*) FROM users')
+                user_count = cursor.fetchone()[0]
             
-            cursor.execute('SELECT COUNT(*) FROM embeddings')
-            embedding_count = cursor.fetchone()[0]
-        
-        conn.close()
+                cursor.execute('SELECT COUNT(*) FROM embeddings')
+                embedding_count = cursor.fetchone()[0]
         
         return {
             'total_users': user_count,
@@ -524,7 +661,7 @@ def test_database():
     print(f"Get user: {user}")
     
     # Test add embedding
-    test_embedding = np.random.randn(512).astype(np.float64)
+    test_embedding = np.random.randn(512).astype(np.float32)
     emb_id = db.add_embedding('user1', test_embedding)
     print(f"Add embedding ID: {emb_id}")
     
@@ -545,6 +682,7 @@ def test_database():
     print(f"Delete user: {'Success' if deleted else 'Failed'}")
     
     # Cleanup
+    db.close()
     os.remove(test_db)
     print("\nDatabase test complete!")
 
@@ -8,7 +8,7 @@ import threading
 import time
 import shutil
 import re
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
@@ -23,6 +23,7 @@ from modules.embeddings import EmbeddingGenerator
 from modules.verifier import Verifier
 from modules.liveness import LivenessDetector
 from database.db_manager import DatabaseManager
+from utils.helpers import generate_user_id, link_or_copy
 from config import ENROLLED_IMAGES_DIR, LIVENESS_ENABLED
 
 # Set appearance
@@ -226,7 +227,7 @@ class FaceVerificationApp(ctk.CTk):
         try:
             self.loading_label.configure(text="Loading camera module...")
             self.update()
-            self.camera = Camera()
+            self.camera = Camera(skip_frames=True)
             
             self.loading_label.configure(text="Loading face detector...")
             self.update()
@@ -247,9 +248,10 @@ class FaceVerificationApp(ctk.CTk):
             
             # State variables
             self.camera_running = False
-            self.current_frame = None
+            self.current_capture = None  # (undrawn frame, detected faces) from the camera loop
             self.captured_faces = []
             self.captured_images = []
+            self.captured_embeddings = []  # Embedding per captured face (None until generated)
             self.is_processing = False
             
             # Hide loading and build UI
@@ -590,6 +592,7 @@ class FaceVerificationApp(ctk.CTk):
         self.users_list_frame.pack(fill="both", expand=True, padx=20, pady=10)
         
         self.all_users_data = []
+        self.user_search_keys = []  # (name, user_id) lowercased once per load
     
     # === Validation Methods ===
     
@@ -688,6 +691,7 @@ class FaceVerificationApp(ctk.CTk):
         """Reset enrollment state"""
         self.captured_faces = []
         self.captured_images = []
+        self.captured_embeddings = []
         self.entry_user_id.delete(0, "end")
         self.entry_name.delete(0, "end")
         self.name_error.configure(text="")
@@ -734,8 +738,11 @@ class FaceVerificationApp(ctk.CTk):
                 
                 faces = self.detector.detect_faces(frame)
                 
+                # Kept with its detections so Capture reuses them instead of detecting again
+                self.current_capture = (frame.copy(), faces)
+                
                 for face in faces:
-                    x, y, w, h = face['box']
+                    x, y, w, h = face.box
                     cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
                     cv2.putText(frame, "Face Detected", (x, y-10), 
                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
@@ -744,8 +751,6 @@ class FaceVerificationApp(ctk.CTk):
                     cv2.putText(frame, "No face detected", (10, 30),
                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
                 
-                self.current_frame = frame.copy()
-                
                 frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                 frame_rgb = cv2.resize(frame_rgb, (400, 300))
                 img = Image.fromarray(frame_rgb)
@@ -767,17 +772,18 @@ class FaceVerificationApp(ctk.CTk):
     
     def _capture_frame(self):
         """Capture frame for enrollment - checks for duplicate faces first"""
-        if self.current_frame is None:
+        if self.current_capture is None:
             messagebox.showwarning("Error", "No camera frame available!")
             return
         
-        faces = self.detector.detect_faces(self.current_frame)
+        frame, faces = self.current_capture
         
         if not faces:
             messagebox.showwarning("No Face", "No face detected! Please position your face in the frame.")
             return
         
         face = self.detector.get_largest_face(faces)
+        embedding = None
         
         # CHECK FOR DUPLICATE FACE (only on first capture)
         if len(self.captured_faces) == 0:
@@ -785,7 +791,7 @@ class FaceVerificationApp(ctk.CTk):
             self.update()
             
             # Generate embedding for captured face
-            embedding = self.embedding_generator.generate_embedding(face['face_img'])
+            embedding = self.embedding_generator.generate_embedding(face.face_img)
             
             if embedding is not None:
                 # Check against all users in database with STRICT duplicate threshold
@@ -813,7 +819,7 @@ class FaceVerificationApp(ctk.CTk):
         # Get/generate user ID
         user_id = self.entry_user_id.get().strip()
         if not user_id:
-            user_id = f"user_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            user_id = generate_user_id()
             self.entry_user_id.delete(0, "end")
             self.entry_user_id.insert(0, user_id)
         
@@ -821,10 +827,12 @@ class FaceVerificationApp(ctk.CTk):
         os.makedirs(user_dir, exist_ok=True)
         
         img_path = os.path.join(user_dir, f"img_{len(self.captured_images) + 1}.jpg")
-        cv2.imwrite(img_path, self.current_frame)
+        cv2.imwrite(img_path, frame)
         
-        self.captured_faces.append(face['face_img'])
+        self.captured_faces.append(face.face_img)
         self.captured_images.append(img_path)
+        # Reused by _save_enrollment instead of embedding this face again
+        self.captured_embeddings.append(embedding)
         
         count = len(self.captured_faces)
         self.enroll_progress.configure(text=f"📸 Captured: {count} images")
@@ -856,30 +864,30 @@ class FaceVerificationApp(ctk.CTk):
         
         user_id = self.entry_user_id.get().strip()
         if not user_id:
-            user_id = f"user_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            user_id = generate_user_id()
             self.entry_user_id.delete(0, "end")
             self.entry_user_id.insert(0, user_id)
         
         user_dir = os.path.join(ENROLLED_IMAGES_DIR, user_id)
         os.makedirs(user_dir, exist_ok=True)
         
+        # Decode all files in parallel (imread releases the GIL); detection
+        # stays sequential because the shared FaceDetector is not thread-safe
+        with ThreadPoolExecutor(max_workers=min(8, len(file_paths))) as executor:
+            images = list(executor.map(cv2.imread, file_paths))
+        
         success_count = 0
-        for file_path in file_paths:
+        for file_path, img in zip(file_paths, images):
+            face_img = self._detect_largest_face(img)
+            if face_img is None:
+                continue
             try:
-                img = cv2.imread(file_path)
-                if img is None:
-                    continue
-                
-                faces = self.detector.detect_faces(img)
-                if not faces:
-                    continue
-                
-                face = self.detector.get_largest_face(faces)
                 new_path = os.path.join(user_dir, f"img_{len(self.captured_images) + 1}.jpg")
-                shutil.copy2(file_path, new_path)
+                link_or_copy(file_path, new_path)
                 
-                self.captured_faces.append(face['face_img'])
+                self.captured_faces.append(face_img)
                 self.captured_images.append(new_path)
+                self.captured_embeddings.append(None)
                 success_count += 1
             except Exception:
                 continue
@@ -897,6 +905,20 @@ class FaceVerificationApp(ctk.CTk):
         else:
             messagebox.showwarning("No Faces", "No valid face images found in selected files!")
     
+    def _detect_largest_face(self, img):
+        """Return the largest face crop of a decoded image file (or None)"""
+        try:
+            if img is None:
+                return None
+            
+            faces = self.detector.detect_faces(img)
+            if not faces:
+                return None
+            
+            return self.detector.get_largest_face(faces).face_img
+        except Exception:
+            return None
+    
     def _save_enrollment(self):
         """Save user enrollment"""
         if not self.captured_faces:
@@ -919,21 +941,30 @@ class FaceVerificationApp(ctk.CTk):
         
         def process():
             try:
-                embeddings = []
-                for i, face_img in enumerate(self.captured_faces):
-                    self.enroll_status.configure(text=f"Generating embedding {i+1}/{len(self.captured_faces)}...")
-                    embedding = self.embedding_generator.generate_embedding(face_img)
-                    if embedding is not None:
-                        embeddings.append(embedding)
+                # Only embed faces the duplicate check has not already embedded
+                pending = [i for i, e in enumerate(self.captured_embeddings) if e is None]
+                self.enroll_status.configure(text=f"Generating {len(pending)} embeddings...")
+                new_embeddings, new_indices = self.embedding_generator.generate_embeddings_batch(
+                    [self.captured_faces[i] for i in pending], return_indices=True
+                )
+                
+                by_index = {i: e for i, e in enumerate(self.captured_embeddings) if e is not None}
+                for j, embedding in zip(new_indices, new_embeddings):
+                    by_index[pending[j]] = embedding
+                indices = sorted(by_index)
+                embeddings = [by_index[i] for i in indices]
                 
                 if not embeddings:
                     self.after(0, lambda: messagebox.showerror("Error", "Could not generate face embeddings!"))
                     return
                 
                 self.db.add_user(user_id, name)
-                for i, embedding in enumerate(embeddings):
-                    img_path = self.captured_images[i] if i < len(self.captured_images) else None
-                    self.db.add_embedding(user_id, embedding, img_path)
+                img_paths = [
+                    self.captured_images[i] if i < len(self.captured_images) else None
+                    for i in indices
+                ]
+                self.db.add_embeddings_bulk(user_id, embeddings, img_paths)
+                self.verifier.add_to_cache(user_id, name, embeddings)
                 
                 self.after(0, lambda: self._enrollment_complete(user_id, name, len(embeddings)))
                 
@@ -1006,10 +1037,10 @@ class FaceVerificationApp(ctk.CTk):
                         
                         if faces:
                             face = self.detector.get_largest_face(faces)
-                            x, y, w, h = face['box']
+                            x, y, w, h = face.box
                             last_box = (x, y, w, h)
                             
-                            embedding = self.embedding_generator.generate_embedding(face['face_img'])
+                            embedding = self.embedding_generator.generate_embedding(face.face_img)
                             
                             if embedding is not None:
                                 result = self.verifier.verify_with_database(embedding, self.db)
@@ -1052,14 +1083,13 @@ class FaceVerificationApp(ctk.CTk):
                         print(f"Processing error: {e}")
                 
                 # Draw cached box on every frame
-                display_frame = frame.copy()
                 if last_box:
                     x, y, w, h = last_box
-                    cv2.rectangle(display_frame, (x, y), (x + w, y + h), last_color, 3)
+                    cv2.rectangle(frame, (x, y), (x + w, y + h), last_color, 3)
                 
                 # Convert for display
                 try:
-                    frame_rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
+                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                     frame_rgb = cv2.resize(frame_rgb, (480, 360))
                     img = Image.fromarray(frame_rgb)
                     photo = ctk.CTkImage(img, size=(480, 360))
@@ -1128,7 +1158,7 @@ class FaceVerificationApp(ctk.CTk):
                 return
             
             face = self.detector.get_largest_face(faces)
-            embedding = self.embedding_generator.generate_embedding(face['face_img'])
+            embedding = self.embedding_generator.generate_embedding(face.face_img)
             
             if embedding is None:
                 messagebox.showerror("Error", "Could not process face!")
@@ -1136,7 +1166,7 @@ class FaceVerificationApp(ctk.CTk):
             
             result = self.verifier.verify_with_database(embedding, self.db)
             
-            x, y, w, h = face['box']
+            x, y, w, h = face.box
             if result['verified']:
                 color = (0, 255, 0)
                 self.verify_result.configure(
@@ -1200,6 +1230,7 @@ class FaceVerificationApp(ctk.CTk):
         
         users = self.db.get_all_users()
         self.all_users_data = users
+        self.user_search_keys = [(u['name'].lower(), u['user_id'].lower()) for u in users]
         
         if not users:
             ctk.CTkLabel(
@@ -1249,8 +1280,8 @@ class FaceVerificationApp(ctk.CTk):
             self._display_users(self.all_users_data)
             return
         
-        filtered = [u for u in self.all_users_data 
-                   if search in u['name'].lower() or search in u['user_id'].lower()]
+        filtered = [u for u, (name, user_id) in zip(self.all_users_data, self.user_search_keys)
+                   if search in name or search in user_id]
         self._display_users(filtered)
     
     def _delete_user(self, user_id, name):
@@ -1265,6 +1296,7 @@ class FaceVerificationApp(ctk.CTk):
                 shutil.rmtree(user_dir)
             
             self.db.delete_user(user_id)
+            self.verifier.invalidate_cache(user_id)
             self._update_user_list()
             self._update_stats()
             messagebox.showinfo("Deleted", f"User '{name}' has been deleted.")
@@ -1291,6 +1323,8 @@ class FaceVerificationApp(ctk.CTk):
     def _on_closing(self):
         """Handle window close"""
         self._stop_camera()
+        if hasattr(self, 'db'):
+            self.db.close()
         self.destroy()
 
 
@@ -5,7 +5,10 @@ Main Application Entry Point
 import os
 import sys
 import cv2
+import queue
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import Tk, filedialog
 
 # Add project root to path
@@ -16,11 +19,12 @@ from modules.face_detector import FaceDetector
 from modules.embeddings import EmbeddingGenerator
 from modules.verifier import Verifier
 from modules.liveness import LivenessDetector
+from modules.pipeline import PipelineRunner
 from database.db_manager import DatabaseManager
 from ui.display import Display
 from utils.helpers import (
     generate_user_id, save_image, print_menu, 
-    get_user_input, clear_console, format_timestamp
+    get_user_input, clear_console, format_timestamp, link_or_copy
 )
 from config import (
     ENROLLED_IMAGES_DIR, LIVENESS_ENABLED,
@@ -43,6 +47,10 @@ class FaceVerificationSystem:
         self.db = DatabaseManager()
         self.display = Display()
         
+        # Background display thread state (see _start_display_thread)
+        self._disp_thread = None
+        self._disp_key = -1
+        
         print("System initialized successfully!")
     
     def run(self):
@@ -139,13 +147,10 @@ class FaceVerificationSystem:
         
         print(f"\nProcessing {len(captured_faces)} images...")
         
-        # Generate embeddings
-        embeddings = []
-        for i, face_img in enumerate(captured_faces):
-            print(f"Generating embedding {i + 1}/{len(captured_faces)}...")
-            embedding = self.embedding_generator.generate_embedding(face_img)
-            if embedding is not None:
-                embeddings.append(embedding)
+        # Generate embeddings (one batched model call)
+        embeddings, indices = self.embedding_generator.generate_embeddings_batch(
+            captured_faces, return_indices=True
+        )
         
         if not embeddings:
             print("Error: Could not generate any embeddings!")
@@ -155,9 +160,9 @@ class FaceVerificationSystem:
         # Save to database
         self.db.add_user(user_id, name)
         
-        for i, embedding in enumerate(embeddings):
-            image_path = captured_images[i] if i < len(captured_images) else None
-            self.db.add_embedding(user_id, embedding, image_path)
+        image_paths = [captured_images[i] if i < len(captured_images) else None for i in indices]
+        self.db.add_embeddings_bulk(user_id, embeddings, image_paths)
+        self.verifier.add_to_cache(user_id, name, embeddings)
         
         print(f"\n{'=' * 40}")
         print(f"User enrolled successfully!")
@@ -206,37 +211,54 @@ class FaceVerificationSystem:
         captured_faces = []
         captured_images = []
         
-        for i, file_path in enumerate(file_paths):
+        # Decode all files in parallel (imread releases the GIL); detection
+        # stays sequential because the shared FaceDetector is not thread-safe
+        with ThreadPoolExecutor(max_workers=min(8, len(file_paths))) as executor:
+            images = list(executor.map(cv2.imread, file_paths))
+        
+        for i, (file_path, img) in enumerate(zip(file_paths, images)):
             print(f"\nProcessing image {i + 1}: {os.path.basename(file_path)}")
             
-            # Read image
-            img = cv2.imread(file_path)
-            if img is None:
-                print(f"  Error: Could not read image")
+            face_img, error = self._detect_largest_face(img)
+            if error:
+                print(f"  {error}")
                 continue
             
-            # Detect faces
-            faces = self.detector.detect_faces(img)
-            
-            if not faces:
-                print(f"  Warning: No face detected in this image")
-                continue
-            
-            # Get largest face
-            face = self.detector.get_largest_face(faces)
-            
             # Copy image to user directory
             new_filename = f"img_{len(captured_images) + 1}{os.path.splitext(file_path)[1]}"
             new_path = os.path.join(user_dir, new_filename)
-            shutil.copy2(file_path, new_path)
+            link_or_copy(file_path, new_path)
             
-            captured_faces.append(face['face_img'])
+            captured_faces.append(face_img)
             captured_images.append(new_path)
             print(f"  Success: Face detected and saved")
         
         print(f"\nTotal valid images: {len(captured_faces)}")
         return captured_faces, captured_images
     
+    def _detect_largest_face(self, img):
+        """
+        Crop the largest face from a decoded image file
+        
+        Args:
+            img: Image from cv2.imread (None if it could not be read)
+            
+        Returns:
+            tuple: (face_img, error) where error is None on success
+        """
+        if img is None:
+            return None, "Error: Could not read image"
+        
+        # Detect faces
+        faces = self.detector.detect_faces(img)
+        
+        if not faces:
+            return None, "Warning: No face detected in this image"
+        
+        # Get largest face
+        face = self.detector.get_largest_face(faces)
+        return face.face_img, None
+    
     def _enroll_from_camera(self, user_dir):
         """Enroll user using webcam"""
         print("\n" + "-" * 40)
@@ -266,8 +288,8 @@ class FaceVerificationSystem:
                 
                 # Draw faces
                 for face in faces:
-                    x, y, w, h = face['box']
-                    quality = self.detector.check_quality(face['face_img'])
+                    x, y, w, h = face.box
+                    quality = self.detector.check_quality(face.face_img, face.gray_img)
                     
                     if quality['passed']:
                         self.display.draw_face_box(frame, (x, y, w, h), 'verified', 'Good Quality')
@@ -291,7 +313,7 @@ class FaceVerificationSystem:
                         # Save image (no quality check - accept all)
                         img_path = save_image(frame, user_dir, f"img_{len(captured_images) + 1}.jpg")
                         captured_images.append(img_path)
-                        captured_faces.append(face['face_img'])
+                        captured_faces.append(face.face_img)
                         print(f"Captured image {len(captured_images)}")
                     else:
                         print("No face detected!")
@@ -385,7 +407,7 @@ class FaceVerificationSystem:
         print("Face detected! Generating embedding...")
         
         # Generate embedding
-        embedding = self.embedding_generator.generate_embedding(face['face_img'])
+        embedding = self.embedding_generator.generate_embedding(face.face_img)
         
         if embedding is None:
             print("Error: Could not generate embedding!")
@@ -406,7 +428,7 @@ class FaceVerificationSystem:
         print("=" * 40)
         
         # Show image with result
-        x, y, w, h = face['box']
+        x, y, w, h = face.box
         color = (0, 255, 0) if result['verified'] else (0, 0, 255)
         cv2.rectangle(img, (x, y), (x + w, y + h), color, 3)
         
@@ -442,32 +464,39 @@ class FaceVerificationSystem:
         if self.liveness:
             self.liveness.reset()
         
+        # Capture, detection and verification run on their own threads;
+        # this thread only draws finished results
+        runner = PipelineRunner(
+            self.camera, self.detector, self.embedding_generator,
+            self.verifier, self.db
+        )
+        
         try:
-            self.camera.start()
+            runner.start()
+            self._start_display_thread()
             
             while True:
-                ret, frame = self.camera.read_frame()
-                if not ret:
-                    print("Error: Could not read from camera")
+                if not runner.is_running():
+                    if runner.error:
+                        print(f"Error: {runner.error}")
                     break
                 
-                # Detect faces
-                faces = self.detector.detect_faces(frame)
+                key = self._disp_key
+                if key == ord('q') or key == ord('Q') or key == 27:  # Q or ESC
+                    break
                 
-                if faces:
-                    face = self.detector.get_largest_face(faces)
-                    x, y, w, h = face['box']
-                    
-                    # Generate embedding (skip quality check)
-                    embedding = self.embedding_generator.generate_embedding(face['face_img'])
+                out = runner.get_result()
+                if out is None:
+                    continue
+                
+                frame = out['frame']
+                face = out['face']
+                result = out['result']
+                
+                if face is not None:
+                    x, y, w, h = face.box
                     
-                    if embedding is not None:
-                        # Verify against database
-                        result = self.verifier.verify_with_database(embedding, self.db)
-                        
-                        # Apply voting
-                        result = self.verifier.verify_with_voting(result)
-                        
+                    if result is not None:
                         # Draw result
                         if result['verified']:
                             self.display.draw_face_box(
@@ -487,24 +516,67 @@ class FaceVerificationSystem:
                             self.display.draw_verification_result(frame, result)
                 else:
                     self.display.draw_status(frame, "No face detected", 'top', (0, 255, 255))
-                    self.verifier.reset_voting()
                 
                 # Draw FPS
                 self.display.draw_fps(frame, self.camera.get_fps())
                 
-                self.display.show(frame)
-                
-                key = self.display.wait_key(1)
-                if key == ord('q') or key == ord('Q') or key == 27:  # Q or ESC
-                    break
+                # Hand the frame to the display thread (never blocks)
+                self._publish_frame(frame)
             
-            self.camera.stop()
-            self.display.close()
+            runner.stop()
+            self._stop_display_thread()
             
         except Exception as e:
             print(f"Error during verification: {e}")
-            self.camera.stop()
-            self.display.close()
+            runner.stop()
+            self._stop_display_thread()
+    
+    def _start_display_thread(self):
+        """Start the background thread that owns the display window"""
+        self._disp_q = queue.Queue(maxsize=1)
+        self._disp_key = -1
+        self._disp_stop = threading.Event()
+        self._disp_thread = threading.Thread(target=self._disp_loop, daemon=True)
+        self._disp_thread.start()
+    
+    def _disp_loop(self):
+        """Show the newest published frame and poll the keyboard"""
+        while not self._disp_stop.is_set():
+            try:
+                frame = self._disp_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            
+            self.display.show(frame)
+            
+            # HighGUI only reports keys on the thread that owns the window
+            key = self.display.wait_key(1)
+            if key != -1 and key != 255:
+                self._disp_key = key
+        
+        self.display.close()
+    
+    def _publish_frame(self, frame):
+        """Queue a frame for display, dropping any frame not yet shown"""
+        try:
+            self._disp_q.put_nowait(frame)
+        except queue.Full:
+            try:
+                self._disp_q.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self._disp_q.put_nowait(frame)
+            except queue.Full:
+                pass
+    
+    def _stop_display_thread(self):
+        """Stop the display thread and close its window"""
+        if self._disp_thread is None:
+            return
+        self._disp_stop.set()
+        self._disp_thread.join(timeout=1.0)
+        self._disp_thread = None
     
     def manage_users(self):
         """Manage enrolled users"""
@@ -561,6 +633,7 @@ class FaceVerificationSystem:
                     
                     # Delete from database
                     self.db.delete_user(user_id)
+                    self.verifier.invalidate_cache(user_id)
                     print(f"\nUser '{user_id}' deleted successfully!")
                 else:
                     print("\nDeletion cancelled.")
@@ -570,6 +643,7 @@ class FaceVerificationSystem:
 
 def main():
     """Main entry point"""
+    system = None
     try:
         system = FaceVerificationSystem()
         system.run()
@@ -581,6 +655,8 @@ def main():
         traceback.print_exc()
     finally:
         cv2.destroyAllWindows()
+        if system is not None:
+            system.db.close()
 
 
 if __name__ == "__main__":
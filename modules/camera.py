@@ -4,6 +4,8 @@ Camera Module - Handles video capture from webcam
 import cv2
 import time
 import os
+import threading
+from collections import deque
 from config import CAMERA_INDEX, CAMERA_WIDTH, CAMERA_HEIGHT, TARGET_FPS
 
 # Suppress OpenCV warnings
@@ -13,7 +15,8 @@ os.environ["OPENCV_VIDEOIO_MSMF_ENABLE_HW_TRANSFORMS"] = "0"
 class Camera:
     """Handles webcam capture operations"""
     
-    def __init__(self, camera_index=CAMERA_INDEX, width=CAMERA_WIDTH, height=CAMERA_HEIGHT):
+    def __init__(self, camera_index=CAMERA_INDEX, width=CAMERA_WIDTH, height=CAMERA_HEIGHT,
+                 skip_frames=False):
         """
         Initialize camera
         
@@ -21,6 +24,9 @@ class Camera:
             camera_index: Camera device index (0 for default webcam)
             width: Frame width
             height: Frame height
+            skip_frames: Grab frames on a background thread and always return
+                         the newest one, dropping frames the caller was too
+                         slow to process
         """
         self.camera_index = camera_index
         self.width = width
@@ -29,6 +35,16 @@ class Camera:
         self.fps = 0
         self.frame_count = 0
         self.start_time = None
+        self._t_ring = deque(maxlen=30)  # Monotonic timestamps of recent frames
+        
+        # Latest-frame slot filled by the grabber thread (skip_frames mode)
+        self.skip_frames = skip_frames
+        self._grabber = None
+        self._running = False
+        self._latest = (False, None)
+        self._latest_seq = 0
+        self._read_seq = 0
+        self._cond = threading.Condition()
         
     def start(self):
         """Start the camera capture"""
@@ -47,6 +63,12 @@ class Camera:
                 "  3. Camera permissions are enabled"
             )
         
+        # Request MJPG (about half the USB bandwidth of YUY2) and a 1-frame
+        # buffer so reads return the newest frame instead of a queued one
+        if not self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG')):
+            print("Camera does not support MJPG, using default pixel format")
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        
         # Set camera properties
         self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
         self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
@@ -58,6 +80,12 @@ class Camera:
         
         self.start_time = time.time()
         self.frame_count = 0
+        self._t_ring.clear()
+        
+        if self.skip_frames:
+            self._running = True
+            self._grabber = threading.Thread(target=self._grab_loop, name="camera-grabber", daemon=True)
+            self._grabber.start()
         
         print("Camera started successfully!")
         return True
@@ -72,23 +100,66 @@ class Camera:
         if self.cap is None or not self.cap.isOpened():
             return False, None
         
-        ret, frame = self.cap.read()
+        if self._grabber is not None:
+            ret, frame = self._read_latest()
+        else:
+            ret, frame = self.cap.read()
         
         if ret:
             self.frame_count += 1
-            # Calculate FPS every 30 frames
-            if self.frame_count % 30 == 0:
-                elapsed = time.time() - self.start_time
-                self.fps = self.frame_count / elapsed if elapsed > 0 else 0
+            self._t_ring.append(time.monotonic())
         
         return ret, frame
     
+    def _grab_loop(self):
+        """Keep reading the camera, holding only the newest frame"""
+        while self._running:
+            ret, frame = self.cap.read()
+            with self._cond:
+                self._latest = (ret, frame)
+                self._latest_seq += 1
+                self._cond.notify_all()
+            if not ret:
+                break
+    
+    def _read_latest(self, timeout=1.0):
+        """Wait for a frame newer than the last one returned, then return it"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._latest_seq > self._read_seq, timeout):
+                return False, None
+            self._read_seq = self._latest_seq
+            return self._latest
+    
+    def read_frame_with_gray(self):
+        """
+        Read a frame together with its grayscale version
+        
+        The grayscale conversion is done once here so detection, quality
+        checks and eye detection can all slice the same buffer.
+        
+        Returns:
+            tuple: (success, frame, gray) where gray is None if the read failed
+        """
+        ret, frame = self.read_frame()
+        if not ret:
+            return False, None, None
+        return True, frame, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    
     def get_fps(self):
-        """Get current FPS"""
+        """Get current FPS (averaged over the last 30 frames)"""
+        if len(self._t_ring) >= 2:
+            elapsed = self._t_ring[-1] - self._t_ring[0]
+            self.fps = (len(self._t_ring) - 1) / elapsed if elapsed > 0 else 0
         return self.fps
     
     def stop(self):
         """Stop and release the camera"""
+        if self._grabber is not None:
+            self._running = False
+            self._grabber.join(timeout=2.0)
+            self._grabber = None
+            self._latest = (False, None)
+        
         if self.cap is not None:
             self.cap.release()
             self.cap = None
@@ -1,8 +1,26 @@
 """
 Embeddings Module - Generates face embeddings using DeepFace
 """
+import os
+import cv2
 import numpy as np
-from config import EMBEDDING_MODEL
+from config import EMBEDDING_MODEL, MODEL_CACHE_DIR, USE_GPU
+
+# Embedding vector size for each supported model
+_MODEL_SIZES = {
+    'VGG-Face': 4096,
+    'Facenet': 128,
+    'Facenet512': 512,
+    'OpenFace': 128,
+    'DeepFace': 4096,
+    'DeepID': 160,
+    'ArcFace': 512,
+    'Dlib': 128,
+    'SFace': 128
+}
+
+# ONNX Runtime execution providers, fastest first
+ONNX_PROVIDERS = ["CUDAExecutionProvider", "OpenVINOExecutionProvider", "CPUExecutionProvider"]
 
 
 class EmbeddingGenerator:
@@ -16,16 +34,153 @@ class EmbeddingGenerator:
             model_name: Model to use (VGG-Face, Facenet, Facenet512, etc.)
         """
         self.model_name = model_name
-        self._model = None
-        self._deepface = None
+        self._predict = None
+        self._sess = None
+        self._input_hw = None
+        self._emb_dim = _MODEL_SIZES.get(model_name, 512)
+        self._saved_model_dir = os.path.join(MODEL_CACHE_DIR, f"{model_name}_sm")
+        self._onnx_path = os.path.join(MODEL_CACHE_DIR, f"{model_name}.onnx")
     
     def _load_model(self):
-        """Lazy load the DeepFace model"""
-        if self._deepface is None:
-            from deepface import DeepFace
-            self._deepface = DeepFace
-            # Pre-load model by running a dummy embedding
-            print(f"Loading {self.model_name} model (first time may take a moment)...")
+        """
+        Lazy load the model, preferring (in order) an ONNX Runtime session,
+        the cached SavedModel from a previous run, then DeepFace itself
+        """
+        if self._predict is not None:
+            return
+        
+        if os.path.isfile(self._onnx_path):
+            try:
+                self._load_onnx_model()
+                return
+            except ImportError:
+                pass
+            except Exception as e:
+                print(f"Could not load ONNX model ({e}), falling back to TensorFlow...")
+        
+        if os.path.isdir(self._saved_model_dir):
+            try:
+                self._load_saved_model()
+                return
+            except Exception as e:
+                print(f"Could not load cached model ({e}), rebuilding...")
+        
+        from deepface import DeepFace
+        print(f"Loading {self.model_name} model (first time may take a moment)...")
+        
+        # Keep a handle on the underlying Keras model for batched inference
+        client = DeepFace.build_model(self.model_name)
+        model = getattr(client, 'model', client)
+        input_shape = getattr(client, 'input_shape', None) or model.input_shape[1:3]
+        self._input_hw = (input_shape[1], input_shape[0])
+        self._predict = lambda batch: model(batch, training=False).numpy()
+        
+        self._save_model(model)
+        self._export_onnx(model)
+    
+    def _load_onnx_model(self):
+        """Create an ONNX Runtime session for the exported model"""
+        import onnxruntime as ort
+        
+        available = ort.get_available_providers()
+        providers = [p for p in ONNX_PROVIDERS if p in available]
+        if not USE_GPU:
+            providers = [p for p in providers if p != "CUDAExecutionProvider"]
+        
+        self._sess = ort.InferenceSession(self._onnx_path, providers=providers)
+        model_input = self._sess.get_inputs()[0]
+        input_name = model_input.name
+        
+        self._input_hw = (int(model_input.shape[1]), int(model_input.shape[2]))
+        self._predict = lambda batch: self._sess.run(None, {input_name: batch})[0]
+        print(f"Using ONNX Runtime ({self._sess.get_providers()[0]})")
+    
+    def _load_saved_model(self):
+        """Load the serialized model graph written by _save_model"""
+        import tensorflow as tf
+        
+        loaded = tf.saved_model.load(self._saved_model_dir)
+        serve = loaded.signatures['serving_default']
+        _, inputs = serve.structured_input_signature
+        input_name, spec = next(iter(inputs.items()))
+        
+        self._input_hw = (int(spec.shape[1]), int(spec.shape[2]))
+        self._predict = lambda batch: next(iter(
+            serve(**{input_name: tf.constant(batch)}).values()
+        )).numpy()
+        # Keep the loaded object alive, the signature does not own its variables
+        self._saved_model = loaded
+    
+    def _save_model(self, model):
+        """Serialize the model graph so later runs skip DeepFace model building"""
+        try:
+            import tensorflow as tf
+            os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+            tf.saved_model.save(model, self._saved_model_dir)
+        except Exception as e:
+            print(f"Could not cache model to {self._saved_model_dir}: {e}")
+    
+    def _export_onnx(self, model):
+        """Convert the model to ONNX for the next run (needs tf2onnx + onnxruntime)"""
+        try:
+            import tensorflow as tf
+            import tf2onnx
+            import onnxruntime  # noqa: F401 - only export if it can be used
+        except ImportError:
+            return
+        
+        try:
+            h, w = self._input_hw
+            spec = (tf.TensorSpec((None, h, w, 3), tf.float32, name="input"),)
+            tf2onnx.convert.from_keras(model, input_signature=spec, output_path=self._onnx_path)
+        except Exception as e:
+            print(f"Could not export ONNX model to {self._onnx_path}: {e}")
+    
+    def _preprocess(self, face_img):
+        """
+        Prepare a face image for the model the same way DeepFace.represent does
+        (RGB order, aspect-preserving resize, zero padding, 0-1 scaling)
+        
+        Args:
+            face_img: Face image (numpy array, BGR)
+            
+        Returns:
+            numpy array: Float32 image of shape (H, W, 3)
+        """
+        target_h, target_w = self._input_hw
+        img = face_img[:, :, ::-1]
+        
+        # Faces already at the model input size need no resize/pad copies
+        if img.shape[:2] != (target_h, target_w):
+            factor = min(target_h / img.shape[0], target_w / img.shape[1])
+            img = cv2.resize(img, (int(img.shape[1] * factor), int(img.shape[0] * factor)))
+            
+            diff_h = target_h - img.shape[0]
+            diff_w = target_w - img.shape[1]
+            img = np.pad(
+                img,
+                ((diff_h // 2, diff_h - diff_h // 2), (diff_w // 2, diff_w - diff_w // 2), (0, 0)),
+                'constant'
+            )
+            
+            if img.shape[:2] != (target_h, target_w):
+                img = cv2.resize(img, (target_w, target_h))
+        
+        return img.astype(np.float32) / 255.0
+    
+    def _embed(self, batch):
+        """
+        Run preprocessed faces through the model in a single call
+        
+        Args:
+            batch: List of preprocessed face images
+            
+        Returns:
+            numpy array: L2-normalized embeddings, one row per face
+        """
+        output = np.asarray(self._predict(np.stack(batch)), dtype=np.float32)
+        # Normalize embeddings
+        return output / np.linalg.norm(output, axis=1, keepdims=True)
     
     def generate_embedding(self, face_img):
         """
@@ -42,58 +197,63 @@ class EmbeddingGenerator:
         
         try:
             self._load_model()
-            
-            # Generate embedding using DeepFace
-            result = self._deepface.represent(
-                img_path=face_img,
-                model_name=self.model_name,
-                enforce_detection=False,
-                detector_backend='skip'  # Face already detected
-            )
-            
-            if result and len(result) > 0:
-                embedding = np.array(result[0]['embedding'])
-                # Normalize embedding
-                embedding = embedding / np.linalg.norm(embedding)
-                return embedding
-            
-            return None
+            return self._embed([self._preprocess(face_img)])[0]
             
         except Exception as e:
             print(f"Error generating embedding: {e}")
             return None
     
-    def generate_embeddings_batch(self, face_images):
+    def generate_embeddings_batch(self, face_images, return_indices=False):
         """
-        Generate embeddings for multiple face images
+        Generate embeddings for multiple face images in one model call
+        
+        If the batched call fails, falls back to generate_embedding() per
+        image so one bad image or an oversized batch does not lose them all.
         
         Args:
             face_images: List of face images
+            return_indices: Also return the input index of each embedding
             
         Returns:
-            list: List of embedding vectors
+            list: List of embedding vectors (and list of source indices if
+                  return_indices is True, since failed images are dropped)
         """
         embeddings = []
-        for img in face_images:
-            emb = self.generate_embedding(img)
-            if emb is not None:
-                embeddings.append(emb)
+        indices = []
+        
+        try:
+            self._load_model()
+            
+            batch = []
+            for i, img in enumerate(face_images):
+                if img is None or img.size == 0:
+                    continue
+                try:
+                    batch.append(self._preprocess(img))
+                    indices.append(i)
+                except Exception as e:
+                    print(f"Error preprocessing image {i}: {e}")
+            
+            if batch:
+                embeddings = list(self._embed(batch))
+            
+        except Exception as e:
+            print(f"Batched embedding failed ({e}), falling back to per-image")
+            embeddings = []
+            indices = []
+            for i, img in enumerate(face_images):
+                embedding = self.generate_embedding(img)
+                if embedding is not None:
+                    embeddings.append(embedding)
+                    indices.append(i)
+        
+        if return_indices:
+            return embeddings, indices
         return embeddings
     
     def get_embedding_size(self):
         """Get the size of embedding vector for the current model"""
-        model_sizes = {
-            'VGG-Face': 4096,
-            'Facenet': 128,
-            'Facenet512': 512,
-            'OpenFace': 128,
-            'DeepFace': 4096,
-            'DeepID': 160,
-            'ArcFace': 512,
-            'Dlib': 128,
-            'SFace': 128
-        }
-        return model_sizes.get(self.model_name, 512)
+        return self._emb_dim
 
 
 def test_embedding_generator():
@@ -116,7 +276,7 @@ def test_embedding_generator():
             faces = detector.detect_faces(frame)
             
             for face in faces:
-                x, y, w, h = face['box']
+                x, y, w, h = face.box
                 cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
             
             cv2.imshow("Embedding Test", frame)
@@ -127,7 +287,7 @@ def test_embedding_generator():
             elif key == ord('c') and faces:
                 face = detector.get_largest_face(faces)
                 print("Generating embedding...")
-                embedding = generator.generate_embedding(face['face_img'])
+                embedding = generator.generate_embedding(face.face_img)
                 if embedding is not None:
                     print(f"Embedding shape: {embedding.shape}")
                     print(f"Embedding norm: {np.linalg.norm(embedding):.4f}")
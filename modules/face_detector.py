@@ -1,14 +1,28 @@
 """
 Face Detector Module - Handles face detection, alignment, and quality checks
 """
+import os
 import cv2
 import numpy as np
+from dataclasses import dataclass
 from config import (
     MIN_FACE_SIZE, FACE_DETECTION_CONFIDENCE, FACE_DETECTOR_BACKEND,
-    BLUR_THRESHOLD, BRIGHTNESS_MIN, BRIGHTNESS_MAX
+    BLUR_THRESHOLD, BRIGHTNESS_MIN, BRIGHTNESS_MAX, YUNET_MODEL_PATH,
+    DETECTION_MAX_DIM, BLUR_METRIC, BLUR_THRESHOLD_INTEGRAL, USE_GPU
 )
 
 
+@dataclass(slots=True)
+class Face:
+    """A detected face (slots keep per-frame allocations small)"""
+    box: tuple
+    confidence: float
+    face_img: np.ndarray
+    box_padded: tuple | None = None
+    gray_img: np.ndarray | None = None  # View of the grayscale frame, if one was available
+    landmarks: np.ndarray | None = None  # YuNet (5, 2) eye/nose/mouth points
+
+
 class FaceDetector:
     """Handles face detection and quality validation"""
     
@@ -21,68 +35,149 @@ class FaceDetector:
         """
         self.backend = backend
         self.face_cascade = None
+        self._yunet = None
+        self._yunet_size = None
         
-        # Initialize OpenCV cascade for fast detection
         if backend == "opencv":
-            cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-            self.face_cascade = cv2.CascadeClassifier(cascade_path)
+            # Prefer the YuNet CNN (one pass, real confidence and landmarks),
+            # fall back to the Haar cascade if the model file is missing
+            if os.path.isfile(YUNET_MODEL_PATH) and hasattr(cv2, 'FaceDetectorYN'):
+                backend_id, target_id = cv2.dnn.DNN_BACKEND_DEFAULT, cv2.dnn.DNN_TARGET_CPU
+                if USE_GPU and hasattr(cv2, 'cuda') and cv2.cuda.getCudaEnabledDeviceCount() > 0:
+                    backend_id, target_id = cv2.dnn.DNN_BACKEND_CUDA, cv2.dnn.DNN_TARGET_CUDA
+                
+                self._yunet = cv2.FaceDetectorYN.create(
+                    YUNET_MODEL_PATH, '', (320, 320),
+                    score_threshold=FACE_DETECTION_CONFIDENCE,
+                    backend_id=backend_id,
+                    target_id=target_id
+                )
+            else:
+                cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+                self.face_cascade = cv2.CascadeClassifier(cascade_path)
     
-    def detect_faces(self, frame):
+    def detect_faces(self, frame, gray=None):
         """
         Detect faces in a frame
         
         Args:
             frame: BGR image (numpy array)
+            gray: Optional grayscale version of frame, reused instead of converting
             
         Returns:
-            list: List of face dictionaries with 'box', 'confidence', 'face_img'
+            list: List of Face objects (landmarks are set when detected with
+                  YuNet, gray_img whenever a grayscale frame is available)
         """
         if frame is None:
             return []
         
         faces = []
         
-        if self.backend == "opencv":
-            faces = self._detect_opencv(frame)
+        if self._yunet is not None:
+            faces = self._detect_yunet(frame, gray)
+        elif self.backend == "opencv":
+            faces = self._detect_opencv(frame, gray)
         else:
             # Use DeepFace for other backends
-            faces = self._detect_deepface(frame)
+            faces = self._detect_deepface(frame, gray)
         
         return faces
     
-    def _detect_opencv(self, frame):
+    def _detect_opencv(self, frame, gray=None):
         """Detect faces using OpenCV Haar Cascade"""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if gray is None:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        
+        # Detect on a downscaled copy of large frames; crops still come from full-res
+        small, scale = self._downscale(gray)
+        min_size = max(1, int(round(MIN_FACE_SIZE * scale)))
         
         detections = self.face_cascade.detectMultiScale(
-            gray,
+            small,
             scaleFactor=1.1,
             minNeighbors=5,
-            minSize=(MIN_FACE_SIZE, MIN_FACE_SIZE),
+            minSize=(min_size, min_size),
             flags=cv2.CASCADE_SCALE_IMAGE
         )
         
         faces = []
-        for (x, y, w, h) in detections:
-            # Add padding around face
-            padding = int(0.1 * max(w, h))
-            x1 = max(0, x - padding)
-            y1 = max(0, y - padding)
-            x2 = min(frame.shape[1], x + w + padding)
-            y2 = min(frame.shape[0], y + h + padding)
-            
-            face_img = frame[y1:y2, x1:x2]
-            
-            faces.append({
-                'box': (x, y, w, h),
-                'box_padded': (x1, y1, x2 - x1, y2 - y1),
-                'confidence': 1.0,  # OpenCV doesn't provide confidence
-                'face_img': face_img
-            })
+        for det in detections:
+            x, y, w, h = (int(round(v / scale)) for v in det)
+            # OpenCV Haar doesn't provide confidence
+            faces.append(self._crop_face(frame, x, y, w, h, 1.0, gray))
         
         return faces
     
-    def _detect_deepface(self, frame):
+    def _detect_yunet(self, frame, gray=None):
+        """Detect faces using the YuNet ONNX model"""
+        h, w = frame.shape[:2]
+        small, scale = self._downscale(frame)
+        
+        input_size = (small.shape[1], small.shape[0])
+        if self._yunet_size != input_size:
+            self._yunet.setInputSize(input_size)
+            self._yunet_size = input_size
+        
+        _, detections = self._yunet.detect(small)
+        if detections is None:
+            return []
+        
+        faces = []
+        for row in detections:
+            # Row layout: x, y, w, h, 5 (x, y) landmarks, score
+            row = row.copy()
+            row[:14] /= scale
+            x, y, bw, bh = (int(v) for v in row[:4])
+            x, y = max(0, x), max(0, y)
+            bw, bh = min(bw, w - x), min(bh, h - y)
+            if min(bw, bh) < MIN_FACE_SIZE:
+                continue
+            
+            face = self._crop_face(frame, x, y, bw, bh, float(row[14]), gray)
+            # Right eye, left eye, nose tip, right and left mouth corners
+            face.landmarks = row[4:14].reshape(5, 2).astype(np.float32)
+            faces.append(face)
+        
+        return faces
+    
+    def _downscale(self, img):
+        """
+        Shrink an image so its longest side is at most DETECTION_MAX_DIM
+        
+        Args:
+            img: Image to detect on
+            
+        Returns:
+            tuple: (image, scale) where scale maps full-res to returned coordinates
+        """
+        scale = DETECTION_MAX_DIM / max(img.shape[:2])
+        if scale >= 1:
+            return img, 1.0
+        small = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return small, scale
+    
+    def _crop_face(self, frame, x, y, w, h, confidence, gray=None):
+        """Build a Face with a padded crop around a detection box"""
+        # Add padding around face
+        padding = int(0.1 * max(w, h))
+        x1 = max(0, x - padding)
+        y1 = max(0, y - padding)
+        x2 = min(frame.shape[1], x + w + padding)
+        y2 = min(frame.shape[0], y + h + padding)
+        
+        # Always a real copy (ascontiguousarray returns a view for full-width
+        # crops), so overlays drawn on the frame later never reach the crop
+        face_img = frame[y1:y2, x1:x2].copy()
+        
+        return Face(
+            box=(x, y, w, h),
+            box_padded=(x1, y1, x2 - x1, y2 - y1),
+            confidence=confidence,
+            face_img=face_img,
+            gray_img=gray[y1:y2, x1:x2] if gray is not None else None
+        )
+    
+    def _detect_deepface(self, frame, gray=None):
         """Detect faces using DeepFace"""
         try:
             from deepface import DeepFace
@@ -106,14 +201,15 @@ class FaceDetector:
                     x2 = min(frame.shape[1], x + w)
                     y2 = min(frame.shape[0], y + h)
                     
-                    face_img = frame[y:y2, x:x2]
+                    face_img = frame[y:y2, x:x2].copy()
                     
                     if face_img.size > 0:
-                        faces.append({
-                            'box': (x, y, w, h),
-                            'confidence': face_data['confidence'],
-                            'face_img': face_img
-                        })
+                        faces.append(Face(
+                            box=(x, y, w, h),
+                            confidence=face_data['confidence'],
+                            face_img=face_img,
+                            gray_img=gray[y:y2, x:x2] if gray is not None else None
+                        ))
             
             return faces
             
@@ -121,12 +217,13 @@ class FaceDetector:
             print(f"DeepFace detection error: {e}")
             return []
     
-    def check_quality(self, face_img):
+    def check_quality(self, face_img, gray_crop=None):
         """
         Check face image quality
         
         Args:
             face_img: Face image (numpy array)
+            gray_crop: Optional grayscale crop of the face (e.g. face.gray_img)
             
         Returns:
             dict: Quality metrics and overall pass/fail
@@ -135,17 +232,31 @@ class FaceDetector:
             return {'passed': False, 'reason': 'Invalid image'}
         
         # Convert to grayscale for analysis
-        if len(face_img.shape) == 3:
+        if gray_crop is not None:
+            gray = gray_crop
+        elif len(face_img.shape) == 3:
             gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
         else:
             gray = face_img
         
-        # Check blur (Laplacian variance)
-        blur_score = cv2.Laplacian(gray, cv2.CV_64F).var()
-        is_blurry = blur_score < BLUR_THRESHOLD
+        if BLUR_METRIC == "integral":
+            # Check blur and brightness from one integral-image pass
+            blur_score, brightness = self._integral_blur(gray)
+            is_blurry = blur_score < BLUR_THRESHOLD_INTEGRAL
+        else:
+            # Check blur (Laplacian variance) on a small copy; int16 output and a
+            # single meanStdDev reduction avoid a full float64 buffer and a second pass
+            if gray.shape[0] > 96 or gray.shape[1] > 96:
+                small = cv2.resize(gray, (96, 96), interpolation=cv2.INTER_AREA)
+            else:
+                small = gray
+            _, std = cv2.meanStdDev(cv2.Laplacian(small, cv2.CV_16S))
+            blur_score = float(std[0, 0]) ** 2
+            is_blurry = blur_score < BLUR_THRESHOLD
+            
+            # Check brightness (INTER_AREA keeps the mean, so the small copy is enough)
+            brightness = cv2.mean(small)[0]
         
-        # Check brightness
-        brightness = np.mean(gray)
         is_dark = brightness < BRIGHTNESS_MIN
         is_bright = brightness > BRIGHTNESS_MAX
         
@@ -173,6 +284,37 @@ class FaceDetector:
             'reason': ', '.join(reasons) if reasons else 'Good quality'
         }
     
+    def _integral_blur(self, gray, grid=8):
+        """
+        Blur score as the mean local variance over a grid of blocks
+        
+        One cv2.integral2 pass gives sums and squared sums; each block's
+        variance is then four lookups per table, E[x^2] - E[x]^2.
+        
+        Args:
+            gray: Grayscale face image
+            grid: Number of blocks along each side
+            
+        Returns:
+            tuple: (blur_score, brightness)
+        """
+        s, ss = cv2.integral2(gray, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+        h, w = gray.shape[:2]
+        brightness = s[h, w] / (h * w)
+        
+        bh, bw = max(1, h // grid), max(1, w // grid)
+        ys = np.arange(0, h - bh + 1, bh)[:grid]
+        xs = np.arange(0, w - bw + 1, bw)[:grid]
+        y0, x0 = ys[:, None], xs[None, :]
+        y1, x1 = y0 + bh, x0 + bw
+        
+        n = bh * bw
+        block_sum = s[y1, x1] - s[y0, x1] - s[y1, x0] + s[y0, x0]
+        block_sq = ss[y1, x1] - ss[y0, x1] - ss[y1, x0] + ss[y0, x0]
+        variances = block_sq / n - (block_sum / n) ** 2
+        
+        return float(variances.mean()), float(brightness)
+    
     def align_face(self, face_img, target_size=(224, 224)):
         """
         Align and resize face image
@@ -197,16 +339,16 @@ class FaceDetector:
         Get the largest face from detected faces
         
         Args:
-            faces: List of face dictionaries
+            faces: List of Face objects
             
         Returns:
-            Largest face dictionary or None
+            Largest Face or None
         """
         if not faces:
             return None
         
-        largest = max(faces, key=lambda f: f['box'][2] * f['box'][3])
-        return largest
+        areas = np.fromiter((f.box[2] * f.box[3] for f in faces), dtype=np.int32, count=len(faces))
+        return faces[int(areas.argmax())]
 
 
 def test_face_detector():
@@ -227,8 +369,8 @@ def test_face_detector():
             faces = detector.detect_faces(frame)
             
             for face in faces:
-                x, y, w, h = face['box']
-                quality = detector.check_quality(face['face_img'])
+                x, y, w, h = face.box
+                quality = detector.check_quality(face.face_img, face.gray_img)
                 
                 # Draw box
                 color = (0, 255, 0) if quality['passed'] else (0, 0, 255)
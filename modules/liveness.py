@@ -3,9 +3,31 @@ Liveness Detection Module - Detects blinks and head movement for anti-spoofing
 """
 import cv2
 import numpy as np
-from collections import deque
 from config import EAR_THRESHOLD, BLINK_CONSECUTIVE_FRAMES
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# FaceMesh landmark indices of the 6 EAR points (p1..p6) for each eye
+LEFT_EYE_LANDMARKS = [33, 160, 158, 133, 153, 144]
+RIGHT_EYE_LANDMARKS = [362, 385, 387, 263, 373, 380]
+
+
+def _ear_kernel(p):
+    """EAR of a (6, 2) float64 array of eye points (numba-compiled when available)"""
+    A = np.sqrt(np.sum((p[1] - p[5]) ** 2))
+    B = np.sqrt(np.sum((p[2] - p[4]) ** 2))
+    C = np.sqrt(np.sum((p[0] - p[3]) ** 2))
+    return (A + B) / (2.0 * C + 1e-6)
+
+
+if njit is not None:
+    _ear_kernel = njit(cache=True, fastmath=True)(_ear_kernel)
+    # Compile now rather than on the first frame
+    _ear_kernel(np.ones((6, 2)))
+
 
 class LivenessDetector:
     """Detects liveness through blink detection and head movement"""
@@ -14,13 +36,48 @@ class LivenessDetector:
         """Initialize liveness detector"""
         self.blink_counter = 0
         self.total_blinks = 0
-        self.ear_history = deque(maxlen=30)
+        
+        # Ring buffer of the last 30 EAR values
+        self._ear_buf = np.zeros(30, dtype=np.float32)
+        self._ear_idx = 0
+        self._ear_fill = 0
+        
         self.face_cascade = cv2.CascadeClassifier(
             cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
         )
-        self.eye_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_eye.xml'
-        )
+        self.eye_cascade = None
+        self._mesh = None
+        self._load_face_mesh()
+    
+    @property
+    def ear_history(self):
+        """Recent EAR values, oldest first"""
+        if self._ear_fill < len(self._ear_buf):
+            return self._ear_buf[:self._ear_fill].copy()
+        return np.roll(self._ear_buf, -self._ear_idx)
+    
+    @property
+    def smoothed_ear(self):
+        """Mean EAR over the recent history (0.0 before the first frame)"""
+        if self._ear_fill == 0:
+            return 0.0
+        return float(self._ear_buf[:self._ear_fill].mean())
+    
+    def _load_face_mesh(self):
+        """Create the MediaPipe FaceMesh model, or fall back to the Haar eye cascade"""
+        try:
+            import mediapipe as mp
+            self._mesh = mp.solutions.face_mesh.FaceMesh(
+                static_image_mode=False,
+                max_num_faces=1,
+                refine_landmarks=True
+            )
+        except (ImportError, AttributeError):
+            # mediapipe >= 0.10.30 no longer ships the legacy solutions API
+            print("mediapipe FaceMesh unavailable, using Haar eye detection for liveness")
+            self.eye_cascade = cv2.CascadeClassifier(
+                cv2.data.haarcascades + 'haarcascade_eye.xml'
+            )
     
     def calculate_ear(self, eye_points):
         """
@@ -34,28 +91,26 @@ class LivenessDetector:
         Returns:
             float: Eye aspect ratio
         """
-        # Compute euclidean distances
-        A = np.linalg.norm(eye_points[1] - eye_points[5])
-        B = np.linalg.norm(eye_points[2] - eye_points[4])
-        C = np.linalg.norm(eye_points[0] - eye_points[3])
-        
-        ear = (A + B) / (2.0 * C + 1e-6)
-        return ear
+        return float(_ear_kernel(np.asarray(eye_points, dtype=np.float64)))
     
-    def detect_eyes(self, face_img):
+    def detect_eyes(self, face_img, gray_crop=None):
         """
         Detect eyes in face image
         
         Args:
             face_img: Face image (numpy array)
+            gray_crop: Optional grayscale crop of the face, skips the conversion
             
         Returns:
             list: List of eye regions [(x, y, w, h), ...]
         """
-        if face_img is None or face_img.size == 0:
+        if face_img is None or face_img.size == 0 or self.eye_cascade is None:
             return []
         
-        gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY) if len(face_img.shape) == 3 else face_img
+        if gray_crop is not None:
+            gray = gray_crop
+        else:
+            gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY) if len(face_img.shape) == 3 else face_img
         
         eyes = self.eye_cascade.detectMultiScale(
             gray,
@@ -66,32 +121,25 @@ class LivenessDetector:
         
         return eyes
     
-    def detect_blink(self, face_img):
+    def detect_blink(self, face_img, gray_crop=None):
         """
         Detect if eyes are blinking
         
         Args:
             face_img: Face image
+            gray_crop: Optional grayscale crop of the face
             
         Returns:
             dict: Blink detection result
         """
-        eyes = self.detect_eyes(face_img)
-        
-        # Calculate eye openness based on detected eyes
-        if len(eyes) >= 2:
-            # Eyes are open
-            avg_height = np.mean([e[3] for e in eyes])
-            avg_width = np.mean([e[2] for e in eyes])
-            ear_approx = avg_height / (avg_width + 1e-6)
-        elif len(eyes) == 1:
-            # One eye detected (possible partial blink)
-            ear_approx = eyes[0][3] / (eyes[0][2] + 1e-6)
+        if self._mesh is not None:
+            eyes_detected, ear_approx = self._landmark_ear(face_img)
         else:
-            # No eyes detected (eyes closed or face issue)
-            ear_approx = 0.0
+            eyes_detected, ear_approx = self._cascade_ear(face_img, gray_crop)
         
-        self.ear_history.append(ear_approx)
+        self._ear_buf[self._ear_idx] = ear_approx
+        self._ear_idx = (self._ear_idx + 1) % len(self._ear_buf)
+        self._ear_fill = min(self._ear_fill + 1, len(self._ear_buf))
         
         # Detect blink (EAR drops below threshold)
         if ear_approx < EAR_THRESHOLD:
@@ -102,25 +150,84 @@ class LivenessDetector:
             self.blink_counter = 0
         
         return {
-            'eyes_detected': len(eyes),
+            'eyes_detected': eyes_detected,
             'ear': ear_approx,
             'is_blinking': self.blink_counter >= BLINK_CONSECUTIVE_FRAMES,
             'total_blinks': self.total_blinks,
-            'eyes_open': len(eyes) >= 2 and ear_approx > EAR_THRESHOLD
+            'eyes_open': eyes_detected >= 2 and ear_approx > EAR_THRESHOLD
         }
     
-    def check_liveness(self, face_img, require_blink=True):
+    def _landmark_ear(self, face_img):
+        """
+        Compute the true EAR from FaceMesh eye landmarks
+        
+        Args:
+            face_img: Face image (BGR)
+            
+        Returns:
+            tuple: (eyes_detected, average EAR of both eyes)
+        """
+        if face_img is None or face_img.size == 0:
+            return 0, 0.0
+        
+        code = cv2.COLOR_BGR2RGB if len(face_img.shape) == 3 else cv2.COLOR_GRAY2RGB
+        results = self._mesh.process(cv2.cvtColor(face_img, code))
+        
+        if not results.multi_face_landmarks:
+            # No face mesh (eyes closed are still landmarked, so this is a face issue)
+            return 0, 0.0
+        
+        landmarks = results.multi_face_landmarks[0].landmark
+        h, w = face_img.shape[:2]
+        points = np.array([
+            (landmarks[i].x * w, landmarks[i].y * h)
+            for i in LEFT_EYE_LANDMARKS + RIGHT_EYE_LANDMARKS
+        ])
+        
+        ear = (self.calculate_ear(points[:6]) + self.calculate_ear(points[6:])) / 2.0
+        return 2, float(ear)
+    
+    def _cascade_ear(self, face_img, gray_crop=None):
+        """
+        Approximate EAR from Haar eye boxes (used when mediapipe is unavailable)
+        
+        Args:
+            face_img: Face image
+            gray_crop: Optional grayscale crop of the face
+            
+        Returns:
+            tuple: (eyes_detected, approximate EAR)
+        """
+        eyes = self.detect_eyes(face_img, gray_crop)
+        
+        # Calculate eye openness based on detected eyes
+        if len(eyes) >= 2:
+            # Eyes are open
+            avg_height = np.mean([e[3] for e in eyes])
+            avg_width = np.mean([e[2] for e in eyes])
+            ear_approx = avg_height / (avg_width + 1e-6)
+        elif len(eyes) == 1:
+            # One eye detected (possible partial blink)
+            ear_approx = eyes[0][3] / (eyes[0][2] + 1e-6)
+        else:
+            # No eyes detected (eyes closed or face issue)
+            ear_approx = 0.0
+        
+        return len(eyes), ear_approx
+    
+    def check_liveness(self, face_img, require_blink=True, gray_crop=None):
         """
         Check if the face is from a live person
         
         Args:
             face_img: Face image
             require_blink: Whether to require blink detection
+            gray_crop: Optional grayscale crop of the face (e.g. face.gray_img)
             
         Returns:
             dict: Liveness check result
         """
-        blink_result = self.detect_blink(face_img)
+        blink_result = self.detect_blink(face_img, gray_crop)
         
         # Basic liveness: eyes must be detected
         eyes_present = blink_result['eyes_detected'] >= 1
@@ -155,7 +262,8 @@ class LivenessDetector:
         """Reset liveness detection state"""
         self.blink_counter = 0
         self.total_blinks = 0
-        self.ear_history.clear()
+        self._ear_idx = 0
+        self._ear_fill = 0
     
     def get_instructions(self):
         """Get user instructions for liveness check"""
@@ -183,10 +291,10 @@ def test_liveness():
             faces = detector.detect_faces(frame)
             
             for face in faces:
-                x, y, w, h = face['box']
+                x, y, w, h = face.box
                 
                 # Check liveness
-                result = liveness.check_liveness(face['face_img'])
+                result = liveness.check_liveness(face.face_img, gray_crop=face.gray_img)
                 
                 # Draw face box
                 color = (0, 255, 0) if result['is_live'] else (0, 255, 255)
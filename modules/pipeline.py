@@ -0,0 +1,228 @@
+"""
+Pipeline Module - Runs capture, detection and verification on separate threads
+"""
+import queue
+import threading
+import cv2
+
+
+class PipelineRunner:
+    """
+    Producer/consumer pipeline: camera thread -> detector thread -> verifier thread
+    
+    Stages are connected by small bounded queues that drop the oldest item
+    when full, so a slow stage always works on the newest frame instead of
+    building up latency. The caller (main/UI thread) only reads finished
+    results with get_result() and does the drawing and display.
+    """
+    
+    def __init__(self, camera, detector, embedding_generator, verifier, db,
+                 liveness=None, owner_id=None, queue_size=2):
+        """
+        Initialize pipeline
+        
+        Args:
+            camera: Camera instance (only ever read from the camera thread)
+            detector: FaceDetector instance
+            embedding_generator: EmbeddingGenerator instance
+            verifier: Verifier instance
+            db: Database manager instance
+            liveness: Optional LivenessDetector instance
+            owner_id: Optional account ID to filter verification by
+            queue_size: Capacity of each inter-stage queue
+        """
+        self.camera = camera
+        self.detector = detector
+        self.embedding_generator = embedding_generator
+        self.verifier = verifier
+        self.db = db
+        self.liveness = liveness
+        self.owner_id = owner_id
+        
+        self.q_frames = queue.Queue(maxsize=queue_size)
+        self.q_det = queue.Queue(maxsize=queue_size)
+        self.q_results = queue.Queue(maxsize=queue_size)
+        
+        self.error = None
+        self._stop = threading.Event()
+        self._threads = []
+    
+    def start(self):
+        """Start the camera and all pipeline threads"""
+        if not self.camera.is_opened():
+            self.camera.start()
+        
+        self._stop.clear()
+        self.error = None
+        self._threads = [
+            threading.Thread(target=self._camera_loop, name="pipeline-camera", daemon=True),
+            threading.Thread(target=self._detect_loop, name="pipeline-detect", daemon=True),
+            threading.Thread(target=self._verify_loop, name="pipeline-verify", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+    
+    def stop(self):
+        """Signal all threads to finish, wait for them and release the camera"""
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=2.0)
+        self._threads = []
+        self.camera.stop()
+    
+    def is_running(self):
+        """Check if the pipeline threads are still running"""
+        return bool(self._threads) and not self._stop.is_set()
+    
+    def get_result(self, timeout=0.1):
+        """
+        Get the next finished frame from the verifier thread
+        
+        Args:
+            timeout: Seconds to wait for a result
+            
+        Returns:
+            dict: {'frame', 'face', 'result'} (face/result are None when no
+                  face was found), or None if nothing was ready
+        """
+        try:
+            return self.q_results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+    
+    def _put_latest(self, q, item):
+        """Put an item on a bounded queue, dropping the oldest item if full"""
+        while not self._stop.is_set():
+            try:
+                q.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+    
+    def _get(self, q):
+        """Wait for the next item on a queue, returning None once stopped"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+    
+    def _camera_loop(self):
+        """Read frames from the camera (OpenCV capture is not thread-safe)"""
+        while not self._stop.is_set():
+            ret, frame, gray = self.camera.read_frame_with_gray()
+            if not ret:
+                self.error = "Could not read from camera"
+                self._stop.set()
+                break
+            self._put_latest(self.q_frames, (frame, gray))
+    
+    def _detect_loop(self):
+        """Run face detection on the newest captured frame"""
+        while not self._stop.is_set():
+            item = self._get(self.q_frames)
+            if item is None:
+                break
+            
+            # Skip frames that queued up while the last detection ran
+            while True:
+                try:
+                    item = self.q_frames.get_nowait()
+                except queue.Empty:
+                    break
+            frame, gray = item
+            
+            try:
+                faces = self.detector.detect_faces(frame, gray)
+            except Exception as e:
+                print(f"Pipeline detection error: {e}")
+                faces = []
+            
+            self._put_latest(self.q_det, (frame, faces))
+    
+    def _verify_loop(self):
+        """Embed and verify the largest detected face"""
+        while not self._stop.is_set():
+            item = self._get(self.q_det)
+            if item is None:
+                break
+            frame, faces = item
+            
+            face = None
+            result = None
+            
+            try:
+                if faces:
+                    face = self.detector.get_largest_face(faces)
+                    
+                    embedding = self.embedding_generator.generate_embedding(face.face_img)
+                    if embedding is not None:
+                        result = self.verifier.verify_with_database(
+                            embedding, self.db, owner_id=self.owner_id
+                        )
+                        result = self.verifier.verify_with_voting(result)
+                        
+                        if self.liveness is not None:
+                            result['liveness'] = self.liveness.check_liveness(
+                                face.face_img, gray_crop=face.gray_img
+                            )
+                else:
+                    self.verifier.reset_voting()
+            except Exception as e:
+                print(f"Pipeline verification error: {e}")
+            
+            self._put_latest(self.q_results, {'frame': frame, 'face': face, 'result': result})
+
+
+def test_pipeline():
+    """Test the threaded pipeline with webcam"""
+    from camera import Camera
+    from face_detector import FaceDetector
+    from embeddings import EmbeddingGenerator
+    from verifier import Verifier
+    from database.db_manager import DatabaseManager
+    
+    runner = PipelineRunner(
+        Camera(), FaceDetector(), EmbeddingGenerator(), Verifier(), DatabaseManager()
+    )
+    
+    print("Pipeline test - Press 'q' to quit")
+    runner.start()
+    
+    try:
+        while runner.is_running():
+            out = runner.get_result()
+            if out is None:
+                continue
+            
+            frame = out['frame']
+            if out['face'] is not None:
+                x, y, w, h = out['face'].box
+                result = out['result']
+                verified = result is not None and result['verified']
+                color = (0, 255, 0) if verified else (0, 0, 255)
+                label = result['user_name'] if verified else "Not Verified"
+                
+                cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+                cv2.putText(frame, label, (x, y - 10),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+            
+            cv2.imshow("Pipeline Test", frame)
+            
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    finally:
+        runner.stop()
+        cv2.destroyAllWindows()
+    
+    if runner.error:
+        print(f"Pipeline stopped: {runner.error}")
+    print("Pipeline test complete")
+
+
+if __name__ == "__main__":
+    test_pipeline()
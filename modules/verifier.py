@@ -1,13 +1,40 @@
 """
 Verifier Module - Compares embeddings and makes verification decisions
 """
+import logging
+import threading
 import numpy as np
-from collections import deque
 from config import (
     VERIFICATION_THRESHOLD, DISTANCE_METRIC,
-    VERIFICATION_FRAMES, VERIFICATION_MAJORITY
+    VERIFICATION_FRAMES, VERIFICATION_MAJORITY, USE_GPU, ANN_INDEX_THRESHOLD
 )
 
+logger = logging.getLogger(__name__)
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+
+def _cosine_dist(a, b):
+    """Cosine distance of two float32 vectors (numba-compiled when available)"""
+    dot_product = np.sum(a * b)
+    norm1 = np.sqrt(np.sum(a * a))
+    norm2 = np.sqrt(np.sum(b * b))
+    return 1 - dot_product / (norm1 * norm2 + 1e-10)
+
+
+if njit is not None:
+    _cosine_dist = njit(cache=True, fastmath=True)(_cosine_dist)
+    # Compile now rather than on the first frame
+    _cosine_dist(np.ones(2, dtype=np.float32), np.ones(2, dtype=np.float32))
+
 
 class Verifier:
     """Handles face verification by comparing embeddings"""
@@ -22,7 +49,30 @@ class Verifier:
         """
         self.threshold = threshold
         self.metric = metric
-        self.verification_history = deque(maxlen=VERIFICATION_FRAMES)
+        
+        # Sliding window of the last VERIFICATION_FRAMES votes, one bit per frame
+        self._votes = 0
+        self._n = 0
+        self._vote_mask = (1 << VERIFICATION_FRAMES) - 1
+        
+        # Cached enrolled embeddings, one snapshot per owner_id:
+        # owner_id -> ((count, version), snapshot). A snapshot is the tuple
+        # (matrix, norms, owner, users, index): an (N, D) float32 matrix of
+        # L2-normalized rows, their original norms, an int32 row -> user index
+        # into the users tuple of (user_id, name), and a faiss inner-product
+        # index over the same rows (None without faiss). Snapshots are never
+        # modified once published, so searches need no lock; refreshes and
+        # appends build a new one under _lock (API requests run concurrently)
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._buffers = {}  # owner_id -> over-allocated (emb, norm, owner) buffers to append into
+        self._gpu_res = None
+        self._gpu_search_lock = threading.Lock()  # GPU indexes are not safe to search concurrently
+        
+        # Per-user (matrix, norms) blocks the snapshots are built from
+        self._user_cache = {}
+        self._cache_version = 0
+        self._seen_counts = {}
     
     def calculate_distance(self, embedding1, embedding2):
         """
@@ -38,16 +88,12 @@ class Verifier:
         if embedding1 is None or embedding2 is None:
             return float('inf')
         
-        embedding1 = np.array(embedding1)
-        embedding2 = np.array(embedding2)
+        embedding1 = np.asarray(embedding1, dtype=np.float32)
+        embedding2 = np.asarray(embedding2, dtype=np.float32)
         
         if self.metric == 'cosine':
             # Cosine distance
-            dot_product = np.dot(embedding1, embedding2)
-            norm1 = np.linalg.norm(embedding1)
-            norm2 = np.linalg.norm(embedding2)
-            similarity = dot_product / (norm1 * norm2 + 1e-10)
-            distance = 1 - similarity
+            distance = float(_cosine_dist(embedding1, embedding2))
             
         elif self.metric == 'euclidean':
             # Euclidean distance
@@ -75,7 +121,7 @@ class Verifier:
         Returns:
             dict: Verification result with distance, confidence, and match status
         """
-        if query_embedding is None or not stored_embeddings:
+        if query_embedding is None or len(stored_embeddings) == 0:
             return {
                 'verified': False,
                 'distance': float('inf'),
@@ -83,15 +129,25 @@ class Verifier:
                 'user_id': None
             }
         
-        # Calculate distance to each stored embedding
-        distances = []
-        for stored_emb in stored_embeddings:
-            dist = self.calculate_distance(query_embedding, stored_emb)
-            distances.append(dist)
+        # Calculate distance to all stored embeddings at once
+        matrix, norms = self._prepare_matrix(stored_embeddings)
+        distances = self._distances(query_embedding, matrix, norms)
         
         # Use minimum distance
-        min_distance = min(distances)
+        min_distance = float(distances.min())
         
+        return self._build_result(min_distance)
+    
+    def _build_result(self, min_distance):
+        """
+        Convert a best-match distance into a verification result
+        
+        Args:
+            min_distance: Smallest distance to the stored embeddings
+            
+        Returns:
+            dict: Verification result with distance, confidence, and match status
+        """
         # Convert distance to confidence (0-100%)
         if self.metric == 'cosine':
             # Cosine distance is 0-2, threshold typically around 0.4
@@ -111,6 +167,267 @@ class Verifier:
             'confidence': confidence
         }
     
+    def invalidate_cache(self, user_id=None):
+        """
+        Drop cached embeddings after an enrollment or deletion
+        
+        Args:
+            user_id: User whose embeddings changed (None = drop everything)
+        """
+        with self._lock:
+            self._invalidate(user_id)
+    
+    def _invalidate(self, user_id):
+        """invalidate_cache() body; caller holds _lock"""
+        if user_id is None:
+            self._user_cache.clear()
+        else:
+            self._user_cache.pop(user_id, None)
+        self._cache_version += 1
+    
+    def _refresh_cache(self, db_manager, owner_id=None):
+        """
+        Return the owner's cached snapshot, rebuilding it if the database has changed
+        
+        The matrix is assembled from per-user blocks kept in _user_cache, so
+        only users that are new or were invalidated are read from the database.
+        
+        Args:
+            db_manager: Database manager instance
+            owner_id: Optional account ID to filter by
+            
+        Returns:
+            tuple: (matrix, norms, owner, users, index) snapshot, or None if
+                   the owner has no embeddings
+        """
+        count = db_manager.get_statistics(owner_id=owner_id)['total_embeddings']
+        
+        with self._lock:
+            key = (count, self._cache_version)
+            cached = self._snapshots.get(owner_id)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            
+            # Embedding count changed without invalidate_cache() (e.g. another
+            # process wrote to the database): any cached block may be stale
+            seen = self._seen_counts.get(owner_id)
+            if seen is not None and seen[0] != count and seen[1] == self._cache_version:
+                self._user_cache.clear()
+            self._seen_counts[owner_id] = key
+            
+            users = db_manager.get_all_users(owner_id=owner_id)
+            missing = [u['user_id'] for u in users if u['user_id'] not in self._user_cache]
+            
+            if missing and len(missing) == len(users):
+                # Cold cache: one matrix load instead of one query per user
+                matrix, user_ids = db_manager.load_matrix(owner_id=owner_id)
+                rows = {}
+                for i, user_id in enumerate(user_ids):
+                    rows.setdefault(user_id, []).append(i)
+                for user_id in missing:
+                    self._cache_user(user_id, matrix[rows[user_id]] if user_id in rows else [])
+            else:
+                for user_id in missing:
+                    self._cache_user(user_id, db_manager.get_embeddings(user_id))
+            
+            blocks = []
+            cached_users = []
+            for user in users:
+                matrix, norms = self._user_cache[user['user_id']]
+                if matrix is None:
+                    continue
+                blocks.append((matrix, norms))
+                cached_users.append((user['user_id'], user['name']))
+            
+            # Fresh buffers: older snapshots keep viewing the previous ones
+            self._buffers.pop(owner_id, None)
+            snapshot = None
+            
+            if blocks:
+                counts = [len(b[0]) for b in blocks]
+                snapshot = self._append_rows(
+                    owner_id, None,
+                    np.concatenate([b[0] for b in blocks]),
+                    np.concatenate([b[1] for b in blocks]),
+                    np.repeat(np.arange(len(blocks), dtype=np.int32), counts),
+                    tuple(cached_users)
+                )
+            
+            self._snapshots[owner_id] = (key, snapshot)
+            return snapshot
+    
+    def add_to_cache(self, user_id, name, embeddings, owner_id=None):
+        """
+        Append a newly enrolled user's embeddings to the owner's cached snapshot
+        
+        Avoids re-reading the database after an enrollment. Falls back to
+        invalidate_cache() when the cache is not current for this owner.
+        
+        Args:
+            user_id: Enrolled user ID
+            name: Enrolled user's name
+            embeddings: Embeddings that were just stored for the user
+            owner_id: Account ID the user was enrolled under
+        """
+        with self._lock:
+            cached = self._snapshots.get(owner_id)
+            if (cached is None or cached[0][1] != self._cache_version
+                    or user_id in self._user_cache or len(embeddings) == 0):
+                self._invalidate(user_id)
+                return
+            
+            (count, version), snapshot = cached
+            matrix, norms = self._prepare_matrix(embeddings)
+            self._user_cache[user_id] = (matrix, norms)
+            
+            users = (snapshot[3] if snapshot is not None else ()) + ((user_id, name),)
+            snapshot = self._append_rows(
+                owner_id, snapshot, matrix, norms,
+                np.full(len(matrix), len(users) - 1, dtype=np.int32), users
+            )
+            
+            key = (count + len(matrix), version)
+            self._snapshots[owner_id] = (key, snapshot)
+            self._seen_counts[owner_id] = key
+    
+    def _append_rows(self, owner_id, snapshot, matrix, norms, owner, users):
+        """
+        Build a new snapshot with rows appended to an existing one
+        
+        Rows are written past the end of the previous snapshot in
+        geometrically grown buffers, so the previous snapshot's views are
+        never touched. Caller holds _lock.
+        
+        Args:
+            owner_id: Owner whose buffers to append into
+            snapshot: Snapshot to extend (None to start from empty)
+            matrix: Normalized rows to append
+            norms: Original norms of the rows
+            owner: User index of each row
+            users: Users tuple for the new snapshot
+            
+        Returns:
+            tuple: New (matrix, norms, owner, users, index) snapshot
+        """
+        n = 0 if snapshot is None else len(snapshot[2])
+        needed = n + len(matrix)
+        
+        buffers = self._buffers.get(owner_id)
+        if buffers is None or buffers[0].shape[0] < needed:
+            capacity = max(needed, 2 * n, 64)
+            emb_buf = np.empty((capacity, matrix.shape[1]), dtype=np.float32)
+            norm_buf = np.empty(capacity, dtype=np.float32)
+            owner_buf = np.empty(capacity, dtype=np.int32)
+            if n:
+                emb_buf[:n] = snapshot[0]
+                norm_buf[:n] = snapshot[1]
+                owner_buf[:n] = snapshot[2]
+            buffers = (emb_buf, norm_buf, owner_buf)
+            self._buffers[owner_id] = buffers
+        
+        emb_buf, norm_buf, owner_buf = buffers
+        emb_buf[n:needed] = matrix
+        norm_buf[n:needed] = norms
+        owner_buf[n:needed] = owner
+        
+        emb_matrix = emb_buf[:needed]
+        
+        index = None
+        if faiss is not None:
+            prev = snapshot[4] if snapshot is not None else None
+            if prev is not None and isinstance(prev, faiss.IndexHNSWFlat):
+                # Copy the graph rather than rebuilding it; the old snapshot may be searching it
+                index = faiss.clone_index(prev)
+                index.add(np.ascontiguousarray(matrix))
+            else:
+                # Flat indexes (and the switch to HNSW past the threshold) are rebuilt
+                index = self._new_index(matrix.shape[1], needed)
+                index.add(emb_matrix)
+        
+        return (emb_matrix, norm_buf[:needed], owner_buf[:needed], users, index)
+    
+    def _new_index(self, dim, size):
+        """
+        Create an inner-product index for the cached rows
+        
+        Uses an exact flat index on the GPU when one is available, otherwise
+        an exact flat index up to ANN_INDEX_THRESHOLD rows and an approximate
+        HNSW graph (sub-linear search) beyond that.
+        
+        Args:
+            dim: Embedding dimension
+            size: Number of rows the index will hold
+            
+        Returns:
+            faiss index
+        """
+        if USE_GPU and hasattr(faiss, 'StandardGpuResources') and faiss.get_num_gpus() > 0:
+            if self._gpu_res is None:
+                self._gpu_res = faiss.StandardGpuResources()
+            return faiss.index_cpu_to_gpu(self._gpu_res, 0, faiss.IndexFlatIP(dim))
+        
+        if size > ANN_INDEX_THRESHOLD:
+            index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = 64
+            return index
+        
+        return faiss.IndexFlatIP(dim)
+    
+    def _cache_user(self, user_id, embeddings):
+        """Store one user's normalized embedding block in _user_cache"""
+        if len(embeddings) == 0:
+            self._user_cache[user_id] = (None, None)
+        else:
+            self._user_cache[user_id] = self._prepare_matrix(embeddings)
+    
+    def _prepare_matrix(self, embeddings):
+        """
+        Stack embeddings into a contiguous float32 matrix of L2-normalized rows
+        
+        Args:
+            embeddings: List (or 2D array) of embedding vectors
+            
+        Returns:
+            tuple: (matrix of shape (N, D), original row norms of shape (N,))
+        """
+        matrix = np.array(embeddings, dtype=np.float32, ndmin=2)
+        norms = np.linalg.norm(matrix, axis=1)
+        matrix /= (norms[:, None] + 1e-10)
+        return matrix, norms
+    
+    def _distances(self, query_embedding, matrix, norms):
+        """
+        Calculate distances from query embedding to every row of a matrix
+        
+        Args:
+            query_embedding: Embedding to compare
+            matrix: L2-normalized embeddings from _prepare_matrix
+            norms: Original norms of the matrix rows
+            
+        Returns:
+            numpy array: Distance to each row of the matrix
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        query_unit = query / (query_norm + 1e-10)
+        
+        if self.metric not in ('cosine', 'euclidean', 'euclidean_l2'):
+            raise ValueError(f"Unknown metric: {self.metric}")
+        
+        # Rows are pre-normalized, so one matrix-vector product gives all
+        # similarities; every metric is derived from it without another pass
+        sims = matrix @ query_unit
+        
+        if self.metric == 'cosine':
+            return 1 - sims
+        elif self.metric == 'euclidean':
+            # ||a - b||^2 = ||a||^2 + ||b||^2 - 2 ||a|| ||b|| cos(a, b)
+            sq = norms * norms + query_norm * query_norm - 2 * norms * query_norm * sims
+            return np.sqrt(np.maximum(sq, 0))
+        else:
+            # Unit vectors: ||a - b||^2 = 2 - 2 a.b
+            return np.sqrt(np.maximum(2 - 2 * sims, 0))
+    
     def verify_with_database(self, query_embedding, db_manager, owner_id=None):
         """
         Verify against all users in database (filtered by owner)
@@ -123,8 +440,6 @@ class Verifier:
         Returns:
             dict: Verification result including matched user_id if verified
         """
-        users = db_manager.get_all_users(owner_id=owner_id)
-        
         best_match = {
             'verified': False,
             'distance': float('inf'),
@@ -133,33 +448,69 @@ class Verifier:
             'user_name': None
         }
         
-        print(f"\n=== VERIFICATION DEBUG ===")
-        print(f"Checking against {len(users)} users, threshold: {self.threshold}")
+        if query_embedding is None:
+            return best_match
         
-        for user in users:
-            user_id = user['user_id']
-            embeddings = db_manager.get_embeddings(user_id)
+        snapshot = self._refresh_cache(db_manager, owner_id=owner_id)
+        
+        if snapshot is not None:
+            idx, distance = self._nearest(query_embedding, snapshot)
             
-            if not embeddings:
-                continue
+            result = self._build_result(distance)
+            user_id, user_name = snapshot[3][snapshot[2][idx]]
             
-            result = self.verify(query_embedding, embeddings)
+            best_match = {
+                'verified': result['verified'],
+                'distance': result['distance'],
+                'confidence': result['confidence'],
+                'user_id': user_id,
+                'user_name': user_name
+            }
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "verify: embeddings=%d threshold=%.2f best=%s dist=%.4f",
+                0 if snapshot is None else len(snapshot[2]), self.threshold, best_match['user_name'], best_match['distance']
+            )
+        
+        return best_match
+    
+    def _nearest(self, query_embedding, snapshot):
+        """
+        Find the snapshot row closest to the query
+        
+        Uses the FAISS inner-product index when available. Inner product on
+        unit vectors orders rows the same way as cosine and euclidean_l2
+        distance, while plain euclidean needs the row norms (NumPy path).
+        
+        Args:
+            query_embedding: Embedding to search for
+            snapshot: (matrix, norms, owner, users, index) from _refresh_cache
             
-            print(f"  User: {user['name']} | Distance: {result['distance']:.4f} | Verified: {result['verified']}")
+        Returns:
+            tuple: (row index, distance)
+        """
+        matrix, norms, _, _, index = snapshot
+        
+        if index is not None and self.metric in ('cosine', 'euclidean_l2'):
+            query = np.asarray(query_embedding, dtype=np.float32)
+            query_unit = query / (np.linalg.norm(query) + 1e-10)
+            if self._gpu_res is not None:
+                with self._gpu_search_lock:
+                    sims, ids = index.search(query_unit[None, :], 1)
+            else:
+                sims, ids = index.search(query_unit[None, :], 1)
+            sim = float(sims[0, 0])
             
-            if result['distance'] < best_match['distance']:
-                best_match = {
-                    'verified': result['verified'],
-                    'distance': result['distance'],
-                    'confidence': result['confidence'],
-                    'user_id': user_id,
-                    'user_name': user['name']
-                }
-        
-        print(f"  BEST MATCH: {best_match['user_name']} | Distance: {best_match['distance']:.4f}")
-        print(f"=========================\n")
+            if self.metric == 'cosine':
+                distance = 1 - sim
+            else:
+                distance = float(np.sqrt(max(2 - 2 * sim, 0)))
+            return int(ids[0, 0]), distance
         
-        return best_match
+        distances = self._distances(query_embedding, matrix, norms)
+        idx = int(np.argmin(distances))
+        return idx, float(distances[idx])
     
     def verify_with_voting(self, result):
         """
@@ -171,17 +522,19 @@ class Verifier:
         Returns:
             dict: Updated result with voting applied
         """
-        self.verification_history.append(result.copy())
+        bit = 1 if result.get('verified', False) else 0
+        self._votes = ((self._votes << 1) | bit) & self._vote_mask
+        self._n = min(self._n + 1, VERIFICATION_FRAMES)
         
-        if len(self.verification_history) < VERIFICATION_MAJORITY:
+        if self._n < VERIFICATION_MAJORITY:
             # Not enough samples yet
             result['voting_status'] = 'collecting'
-            result['votes'] = len(self.verification_history)
+            result['votes'] = self._n
             result['votes_needed'] = VERIFICATION_MAJORITY
             return result
         
         # Count votes
-        verified_votes = sum(1 for r in self.verification_history if r.get('verified', False))
+        verified_votes = self._votes.bit_count()
         
         # Apply majority voting
         final_verified = verified_votes >= VERIFICATION_MAJORITY
@@ -190,13 +543,14 @@ class Verifier:
         result['verified'] = final_verified
         result['voting_status'] = 'complete'
         result['votes_verified'] = verified_votes
-        result['votes_total'] = len(self.verification_history)
+        result['votes_total'] = self._n
         
         return result
     
     def reset_voting(self):
         """Reset voting history"""
-        self.verification_history.clear()
+        self._votes = 0
+        self._n = 0
     
     def get_confidence_label(self, confidence):
         """
@@ -4,6 +4,21 @@ Run this to verify your webcam works with OpenCV
 """
 import cv2
 import sys
+import queue
+import threading
+
+def reader(cap, frames, stop):
+    """Read frames on a background thread, keeping only the newest one"""
+    while not stop.is_set():
+        ret, frame = cap.read()
+        if frames.full():
+            try:
+                frames.get_nowait()
+            except queue.Empty:
+                pass
+        frames.put((ret, frame))
+        if not ret:
+            break
 
 def test_camera():
     print("=" * 50)
@@ -27,6 +42,12 @@ def test_camera():
         return False
     
     print("[SUCCESS] Camera opened!")
+    
+    # MJPG needs far less USB bandwidth than raw YUY2; keep a 1-frame buffer
+    if not cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG')):
+        print("  (MJPG not supported, using default pixel format)")
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    
     print("\nCamera Properties:")
     print(f"  Width: {cap.get(cv2.CAP_PROP_FRAME_WIDTH)}")
     print(f"  Height: {cap.get(cv2.CAP_PROP_FRAME_HEIGHT)}")
@@ -39,9 +60,18 @@ def test_camera():
     # Create window
     cv2.namedWindow("Camera Test - Press Q to quit", cv2.WINDOW_NORMAL)
     
+    # Capture runs on its own thread; the loop below only draws and displays
+    frames = queue.Queue(maxsize=1)
+    stop = threading.Event()
+    reader_thread = threading.Thread(target=reader, args=(cap, frames, stop), daemon=True)
+    reader_thread.start()
+    
     frame_count = 0
     while True:
-        ret, frame = cap.read()
+        try:
+            ret, frame = frames.get(timeout=2.0)
+        except queue.Empty:
+            ret, frame = False, None
         
         if not ret:
             print("[ERROR] Failed to read frame!")
@@ -64,6 +94,8 @@ def test_camera():
             print(f"\nTest complete! Captured {frame_count} frames.")
             break
     
+    stop.set()
+    reader_thread.join(timeout=2.0)
     cap.release()
     cv2.destroyAllWindows()
     return True
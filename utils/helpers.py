@@ -2,20 +2,34 @@
 Utility Helper Functions
 """
 import os
+import sys
+import shutil
+import subprocess
+import threading
+import time
 import cv2
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+_user_id_lock = threading.Lock()
+_last_user_id_ns = 0
+
 
 def generate_user_id():
     """
     Generate a unique user ID based on timestamp
     
+    Uses nanoseconds, bumped past the last issued value, so enrollments in
+    the same second (or clock tick, on coarse Windows clocks) get distinct IDs.
+    
     Returns:
         str: Unique user ID
     """
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    return f"user_{timestamp}"
+    global _last_user_id_ns
+    with _user_id_lock:
+        _last_user_id_ns = max(time.time_ns(), _last_user_id_ns + 1)
+        return f"user_{_last_user_id_ns}"
 
 
 def save_image(image, directory, filename=None):
@@ -43,6 +57,39 @@ def save_image(image, directory, filename=None):
     return filepath
 
 
+def link_or_copy(src, dst):
+    """
+    Place a file at dst without copying its bytes when possible
+    
+    Tries a hard link first, then (on Linux) a reflink copy, and falls back
+    to a regular copy when source and destination are on different
+    filesystems or linking is not supported.
+    
+    Args:
+        src: Source file path
+        dst: Destination file path
+        
+    Returns:
+        str: Destination path
+    """
+    try:
+        os.link(src, dst)
+        return dst
+    except OSError:
+        pass
+    
+    if sys.platform.startswith('linux'):
+        try:
+            subprocess.run(['cp', '--reflink=auto', '--preserve=timestamps', src, dst],
+                           check=True, capture_output=True)
+            return dst
+        except (OSError, subprocess.CalledProcessError):
+            pass
+    
+    shutil.copy2(src, dst)
+    return dst
+
+
 def load_images_from_directory(directory):
     """
     Load all images from a directory
@@ -53,21 +100,20 @@ def load_images_from_directory(directory):
     Returns:
         list: List of loaded images
     """
-    images = []
-    
     if not os.path.exists(directory):
-        return images
+        return []
     
     valid_extensions = ('.jpg', '.jpeg', '.png', '.bmp')
     
-    for filename in os.listdir(directory):
-        if filename.lower().endswith(valid_extensions):
-            filepath = os.path.join(directory, filename)
-            img = cv2.imread(filepath)
-            if img is not None:
-                images.append(img)
+    with os.scandir(directory) as entries:
+        paths = [entry.path for entry in entries
+                 if entry.name.lower().endswith(valid_extensions) and entry.is_file()]
+    
+    # cv2.imread releases the GIL, so reads and decodes overlap across threads
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        images = list(executor.map(cv2.imread, paths))
     
-    return images
+    return [img for img in images if img is not None]
 
 
 def resize_image(image, max_size=800):
@@ -119,19 +165,37 @@ def enhance_image(image):
     Returns:
         Enhanced image
     """
-    # Convert to LAB color space
-    lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+    # Convert to YUV (cheaper than LAB) and apply CLAHE to the luma channel
+    yuv = cv2.cvtColor(image, cv2.COLOR_BGR2YUV)
     
-    # Apply CLAHE to L channel
     clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    lab[:, :, 0] = clahe.apply(lab[:, :, 0])
+    yuv[:, :, 0] = clahe.apply(yuv[:, :, 0])
     
     # Convert back to BGR
-    enhanced = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+    enhanced = cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR)
     
     return enhanced
 
 
+def enhance_image_gray(image):
+    """
+    Enhance image quality for consumers that only need grayscale
+    
+    Applies the same CLAHE as enhance_image() to the luma plane and returns
+    it directly, skipping the conversion back to color.
+    
+    Args:
+        image: Input BGR image (or an already grayscale image)
+        
+    Returns:
+        Enhanced single-channel image
+    """
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    return clahe.apply(gray)
+
+
 def calculate_image_hash(image):
     """
     Calculate a simple hash for image comparison
@@ -151,11 +215,10 @@ def calculate_image_hash(image):
     # Calculate average
     avg = gray.mean()
     
-    # Create hash based on pixel comparisons
-    hash_bits = gray > avg
-    hash_str = ''.join(['1' if b else '0' for b in hash_bits.flatten()])
+    # Create hash based on pixel comparisons, packed 8 bits per byte
+    hash_bits = np.packbits(gray.ravel() > avg)
     
-    return hex(int(hash_str, 2))
+    return hex(int.from_bytes(hash_bits.tobytes(), 'big'))
 
 
 def format_timestamp(dt=None):